@@ -1,8 +1,13 @@
 # file: data_manager.py
 
 import os
-from sqlalchemy import create_engine, func, desc, event
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from sqlalchemy import create_engine, func, asc, desc, case, event, insert, text
 from sqlalchemy.orm import sessionmaker, joinedload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from functools import lru_cache
 from datetime import datetime
 from models import Base, Project, MIVRecord, MTOItem, MTOConsumption, ActivityLog, MTOProgress, Spool, SpoolItem, \
@@ -17,9 +22,9 @@ import difflib
 # data_manager.py (در ابتدای فایل)
 import logging
 import re
-from typing import Tuple, List, Dict, Any
-import glob
+from typing import Tuple, List, Dict, Any, Optional
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
 import time
 from config_manager import DB_PATH, DASHBOARD_PASSWORD, ISO_PATH
 from ai_engine import Recommender, ShortagePredictor, AnomalyDetector # برای یادگیری ماشین
@@ -36,20 +41,35 @@ SPOOL_TYPE_MAPPING = {
 
     # ... شما می‌توانید آیتم‌های بیشتری به اینجا اضافه کنید
 }
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",  # 256MB
+    "PRAGMA cache_size=-131072;",  # 128MB (مقدار منفی یعنی کیلوبایت)
+)
+
+
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
-    """این تابع هر بار که یک اتصال به دیتابیس برقرار می‌شود، حالت WAL را فعال می‌کند."""
+    """
+    این تابع هر بار که یک اتصال به دیتابیس برقرار می‌شود، حالت WAL را فعال می‌کند.
+    - WAL باعث می‌شود نویسنده‌ها (ورود CSV، ایندکس ISO) خواننده‌ها (پیشنهادها) را قفل نکنند.
+    - mmap و کش صفحه بزرگ‌تر، تأخیر خواندن روی داده‌های گرم را کم می‌کنند.
+    """
     cursor = dbapi_connection.cursor()
     try:
-        cursor.execute("PRAGMA journal_mode=WAL;")
-        cursor.execute("PRAGMA synchronous=NORMAL;")
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
     finally:
         cursor.close()
 
 class DataManager:
-    def __init__(self, db_path=DB_PATH, logger_callback=None):
+    def __init__(self, db_path=DB_PATH, logger_callback=None, pool_size=5):
         """
         کلاس مدیریت تمام تعاملات با پایگاه داده.
+        - pool_size: تعداد اتصال‌های نگه‌داشته‌شده در استخر؛ برای سرور API برابر تعداد تردها تنظیم می‌شود
+          تا هر ترد بدون انتظار یک اتصال آماده داشته باشد (در حالت WAL خواننده‌ها هم‌زمان پیش می‌روند).
         """
         # --- NEW: دریافت و تنظیم لاگر ---
         self.logger = logger_callback if logger_callback else print
@@ -57,10 +77,19 @@ class DataManager:
         self.engine = create_engine(
             f"sqlite:///{db_path}",
             echo=False,
-            connect_args={'timeout': 15}
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=pool_size,
+            connect_args={'timeout': 15, 'check_same_thread': False}
         )
         Base.metadata.create_all(self.engine)
+        self._ensure_indexes()
         self.Session = sessionmaker(bind=self.engine)
+        self._line_fts_enabled = self._ensure_fts_index('mto_line_fts', self._LINE_FTS_DDL)
+        self._iso_fts_enabled = self._ensure_fts_index('iso_name_fts', self._ISO_FTS_DDL)
+        self._ro_conn = self._open_readonly_connection(db_path)
+        self._ro_lock = threading.Lock()  # اتصال sqlite3 بین تردهای کارگر پیشنهاد مشترک است
+        self._data_version_token = os.urandom(4).hex()  # تا نسخه‌های داده پس از راه‌اندازی مجدد با قبلی‌ها یکی نشوند
 
         # --- بارگذاری یا آموزش مدل‌های هوش مصنوعی (با استفاده از لاگر جدید) ---
         self.recommender = Recommender()
@@ -474,7 +503,7 @@ class DataManager:
             ).delete(synchronize_session=False)
 
             if progress_updates:
-                session.bulk_insert_mappings(MTOProgress, progress_updates)
+                session.execute(insert(MTOProgress.__table__), progress_updates)
 
             session.commit()
         except Exception as e:
@@ -518,34 +547,134 @@ class DataManager:
         finally:
             session.close()
 
-    def get_line_no_suggestions(self, typed_text: str, top_n: int = 15) -> List[Dict[str, Any]]:
+    def _ensure_indexes(self):
+        """
+        create_all فقط برای جداول جدید ایندکس می‌سازد؛ ایندکس‌هایی که بعداً به مدل‌ها اضافه شده‌اند
+        روی دیتابیس‌های موجود اینجا ساخته می‌شوند.
+        """
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(self.engine, checkfirst=True)
+                except Exception as e:
+                    logging.warning(f"ایندکس '{index.name}' ساخته نشد: {e}")
+
+    _LINE_FTS_DDL = (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS mto_line_fts USING fts5("
+        "line_no, content='mto_items', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS mto_line_fts_ai AFTER INSERT ON mto_items BEGIN "
+        "INSERT INTO mto_line_fts(rowid, line_no) VALUES (new.id, new.line_no); END",
+        "CREATE TRIGGER IF NOT EXISTS mto_line_fts_ad AFTER DELETE ON mto_items BEGIN "
+        "INSERT INTO mto_line_fts(mto_line_fts, rowid, line_no) VALUES ('delete', old.id, old.line_no); END",
+        "CREATE TRIGGER IF NOT EXISTS mto_line_fts_au AFTER UPDATE OF line_no ON mto_items BEGIN "
+        "INSERT INTO mto_line_fts(mto_line_fts, rowid, line_no) VALUES ('delete', old.id, old.line_no); "
+        "INSERT INTO mto_line_fts(rowid, line_no) VALUES (new.id, new.line_no); END",
+    )
+
+    _ISO_FTS_DDL = (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS iso_name_fts USING fts5("
+        "normalized_name, content='iso_file_index', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS iso_name_fts_ai AFTER INSERT ON iso_file_index BEGIN "
+        "INSERT INTO iso_name_fts(rowid, normalized_name) VALUES (new.id, new.normalized_name); END",
+        "CREATE TRIGGER IF NOT EXISTS iso_name_fts_ad AFTER DELETE ON iso_file_index BEGIN "
+        "INSERT INTO iso_name_fts(iso_name_fts, rowid, normalized_name) "
+        "VALUES ('delete', old.id, old.normalized_name); END",
+        "CREATE TRIGGER IF NOT EXISTS iso_name_fts_au AFTER UPDATE OF normalized_name ON iso_file_index BEGIN "
+        "INSERT INTO iso_name_fts(iso_name_fts, rowid, normalized_name) "
+        "VALUES ('delete', old.id, old.normalized_name); "
+        "INSERT INTO iso_name_fts(rowid, normalized_name) VALUES (new.id, new.normalized_name); END",
+    )
+
+    def _ensure_fts_index(self, fts_table: str, ddl_statements) -> bool:
+        """
+        یک ایندکس FTS5 (توکنایزر trigram) را همراه با تریگرهای همگام‌سازی آن می‌سازد تا جستجوهای
+        LIKE '%...%' به جای اسکن کامل جدول از ایندکس استفاده کنند.
+        - اگر نسخه SQLite از trigram پشتیبانی نکند (قبل از 3.34)، False برمی‌گرداند و کوئری قبلی استفاده می‌شود.
+        """
+        try:
+            with self.engine.begin() as conn:
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {"name": fts_table}).first()
+                for ddl in ddl_statements:
+                    conn.execute(text(ddl))
+                if not exists:
+                    # ساخت اولیه ایندکس از روی داده‌های موجود
+                    conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES('rebuild')"))
+            return True
+        except Exception as e:
+            logging.warning(f"ایندکس FTS '{fts_table}' ساخته نشد، از جستجوی LIKE معمولی استفاده می‌شود: {e}")
+            return False
+
+    _SUGGEST_FTS_SQL = (
+        "SELECT DISTINCT m.line_no, p.name, p.id FROM mto_line_fts f "
+        "JOIN mto_items m ON m.id = f.rowid "
+        "JOIN projects p ON p.id = m.project_id "
+        "WHERE f.line_no LIKE :term LIMIT :limit"
+    )
+    _SUGGEST_LIKE_SQL = (
+        "SELECT DISTINCT m.line_no, p.name, p.id FROM mto_items m "
+        "JOIN projects p ON p.id = m.project_id "
+        "WHERE m.line_no LIKE :term LIMIT :limit"
+    )
+
+    def _open_readonly_connection(self, db_path):
+        """
+        یک اتصال sqlite3 فقط-خواندنی و ماندگار برای مسیر پرتکرار پیشنهادها باز می‌کند.
+        - sqlite3 دستورهای آماده (prepared) را روی همین اتصال کش می‌کند، پس هر کلید فقط bind و اجرا است.
+        - در صورت خطا None برمی‌گرداند و پیشنهادها از طریق session معمولی اجرا می‌شوند.
+        """
+        try:
+            uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA query_only=1")
+            # حالت WAL در فایل دیتابیس ذخیره است؛ بقیه تنظیمات خواندنی را روی این اتصال هم اعمال می‌کنیم
+            for pragma in SQLITE_PRAGMAS[2:]:
+                conn.execute(pragma)
+            return conn
+        except Exception as e:
+            logging.warning(f"اتصال فقط-خواندنی برای پیشنهادها باز نشد: {e}")
+            return None
+
+    def get_data_version_tag(self):
+        """
+        یک برچسب ارزان برای نسخه فعلی داده‌های دیتابیس برمی‌گرداند (مناسب برای ETag).
+        - از PRAGMA data_version روی اتصال فقط-خواندنی استفاده می‌کند که با هر commit از اتصال/پروسه دیگری تغییر می‌کند.
+        - اگر اتصال فقط-خواندنی در دسترس نباشد، None برمی‌گرداند.
+        """
+        if self._ro_conn is None:
+            return None
+        try:
+            with self._ro_lock:
+                version = self._ro_conn.execute("PRAGMA data_version").fetchone()[0]
+            return f"{self._data_version_token}-{version}"
+        except sqlite3.Error as e:
+            logging.warning(f"خواندن نسخه داده ممکن نشد: {e}")
+            return None
+
+    def get_line_no_suggestions(self, typed_text: str, limit: int = 50) -> List[Dict[str, Any]]:
         """
         (نسخه بهینه‌سازی شده با استفاده از LIKE)
-        در تمام پروژه‌ها جستجو کرده و شماره خط‌های مشابه را به همراه نام پروژه پیشنهاد می‌دهد.
-        این جستجو مستقیماً در دیتابیس و با سرعت بالا انجام می‌شود.
+        در تمام پروژه‌ها جستجو کرده و شماره خط‌هایی را که با متن تایپ‌شده شروع می‌شوند به همراه نام پروژه پیشنهاد می‌دهد.
+        جستجو پیشوندی است تا با فیلتر MatchStartsWith کامپلیتر هم‌خوان باشد (نتایج صرفاً شامل‌شونده پنهان می‌شدند).
+        این جستجو مستقیماً در دیتابیس و روی اتصال فقط-خواندنی ماندگار (بدون ORM و session) انجام می‌شود.
         """
         if not typed_text or len(typed_text) < 2:
             return []
 
-        session = self.get_session()
-        try:
-            # ساخت عبارت جستجو برای اپراتور LIKE
-            search_term = f"%{typed_text}%"
-
-            # کوئری بهینه که فیلتر را در دیتابیس اعمال می‌کند
-            query = (
-                session.query(
-                    MTOItem.line_no,
-                    Project.name,
-                    Project.id
-                )
-                .join(Project, MTOItem.project_id == Project.id)
-                .filter(MTOItem.line_no.ilike(search_term))  # ilike برای جستجوی غیرحساس به حروف
-                .distinct()
-                .limit(top_n)
-            )
+        # ایندکس trigram فقط برای عبارت‌های حداقل ۳ حرفی قابل استفاده است؛ LIKE در SQLite غیرحساس به حروف است
+        sql = self._SUGGEST_FTS_SQL if self._line_fts_enabled and len(typed_text) >= 3 else self._SUGGEST_LIKE_SQL
+        params = {"term": f"{typed_text}%", "limit": limit}
 
-            results = query.all()
+        try:
+            if self._ro_conn is not None:
+                with self._ro_lock:
+                    results = self._ro_conn.execute(sql, params).fetchall()
+            else:
+                session = self.get_session()
+                try:
+                    results = session.execute(text(sql), params).all()
+                finally:
+                    session.close()
 
             # تبدیل نتایج به فرمت دیکشنری مورد نیاز UI
             suggestions = [
@@ -562,6 +691,37 @@ class DataManager:
         except Exception as e:
             logging.error(f"خطا در پیشنهاد سراسری شماره خط (بهینه شده): {e}")
             return []
+
+    def get_all_line_nos(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        تمام شماره خط‌های یکتا (به همراه پروژه) را برای ساخت ایندکس پیشوندی در حافظه برمی‌گرداند.
+        خروجی بر اساس کلید 'key' (شماره خط با حروف یکسان‌شده) مرتب است تا با bisect قابل جستجو باشد.
+        در صورت خطا None برمی‌گرداند (نه لیست خالی) تا فراخواننده بتواند شکست را از «هیچ خطی» تشخیص دهد.
+        """
+        session = self.get_session()
+        try:
+            results = (
+                session.query(MTOItem.line_no, Project.name, Project.id)
+                .join(Project, MTOItem.project_id == Project.id)
+                .filter(MTOItem.line_no.isnot(None))
+                .distinct()
+                .all()
+            )
+            rows = [
+                {
+                    'key': line_no.casefold(),
+                    'display': f"{line_no}  ({project_name})",
+                    'line_no': line_no,
+                    'project_name': project_name,
+                    'project_id': project_id
+                }
+                for line_no, project_name, project_id in results
+            ]
+            rows.sort(key=lambda r: r['key'])
+            return rows
+        except Exception as e:
+            logging.error(f"خطا در دریافت لیست شماره خط‌ها: {e}")
+            return None
         finally:
             session.close()
 
@@ -643,6 +803,14 @@ class DataManager:
         finally:
             session.close()
 
+    def project_exists(self, project_id: int) -> bool:
+        """وجود پروژه را با یک جستجوی ایندکس‌شده روی کلید اصلی بررسی می‌کند (بدون بارگذاری ردیف)."""
+        session = self.get_session()
+        try:
+            return session.query(session.query(Project.id).filter(Project.id == project_id).exists()).scalar()
+        finally:
+            session.close()
+
     # --------------------------------------------------------------------
     # متدهای گزارش‌گیری (مربوط به داشبورد و گزارش‌ها)
     # --------------------------------------------------------------------
@@ -974,37 +1142,56 @@ class DataManager:
     def initialize_mto_progress_for_line(self, project_id, line_no):
         session = self.get_session()
         try:
-            mto_items = session.query(MTOItem).filter(
+            # فقط ستون‌های لازم خوانده می‌شوند؛ ردیف‌های سبک به جای آبجکت‌های کامل ORM با state و identity map
+            mto_items = session.query(
+                MTOItem.id, MTOItem.item_type, MTOItem.length_m, MTOItem.quantity,
+                MTOItem.item_code, MTOItem.description, MTOItem.unit
+            ).filter(
                 MTOItem.project_id == project_id,
                 MTOItem.line_no == line_no
             ).all()
 
+            if not mto_items:
+                return
+            item_ids = [item.id for item in mto_items]
+
+            # به جای دو کوئری برای هر آیتم، وضعیت موجود و مصرف کل را با دو کوئری یک‌جا می‌خوانیم
+            existing_ids = {row.mto_item_id for row in session.query(MTOProgress.mto_item_id).filter(
+                MTOProgress.mto_item_id.in_(item_ids))}
+            used_by_item = dict(
+                session.query(MTOConsumption.mto_item_id, func.coalesce(func.sum(MTOConsumption.used_qty), 0.0))
+                .filter(MTOConsumption.mto_item_id.in_(item_ids))
+                .group_by(MTOConsumption.mto_item_id)
+                .all()
+            )
+
+            progress_list = []
             for item in mto_items:
-                exists = session.query(MTOProgress).filter(MTOProgress.mto_item_id == item.id).first()
-                if not exists:
-                    # --- CHANGE: حذف تبدیل واحد ---
-                    is_pipe = item.item_type and 'pipe' in item.item_type.lower()
-                    if is_pipe:
-                        total_required = item.length_m or 0 # دیگر ضرب در ۱۰۰۰ نداریم
-                    else:
-                        total_required = item.quantity or 0
+                if item.id in existing_ids:
+                    continue
+                # --- CHANGE: حذف تبدیل واحد ---
+                is_pipe = item.item_type and 'pipe' in item.item_type.lower()
+                if is_pipe:
+                    total_required = item.length_m or 0 # دیگر ضرب در ۱۰۰۰ نداریم
+                else:
+                    total_required = item.quantity or 0
 
-                    total_used = session.query(func.coalesce(func.sum(MTOConsumption.used_qty), 0.0)) \
-                        .filter(MTOConsumption.mto_item_id == item.id).scalar()
+                total_used = used_by_item.get(item.id, 0.0)
 
-                    new_progress = MTOProgress(
-                        project_id=project_id,
-                        line_no=line_no,
-                        mto_item_id=item.id,
-                        item_code=item.item_code,
-                        description=item.description,
-                        unit=item.unit,
-                        total_qty=round(total_required, 2),
-                        used_qty=round(total_used, 2),
-                        remaining_qty=round(max(0, total_required - total_used), 2),
-                        last_updated=datetime.now()
-                    )
-                    session.add(new_progress)
+                progress_list.append({
+                    'project_id': project_id,
+                    'line_no': line_no,
+                    'mto_item_id': item.id,
+                    'item_code': item.item_code,
+                    'description': item.description,
+                    'unit': item.unit,
+                    'total_qty': round(total_required, 2),
+                    'used_qty': round(total_used, 2),
+                    'remaining_qty': round(max(0, total_required - total_used), 2),
+                    'last_updated': datetime.now()
+                })
+            if progress_list:
+                session.execute(insert(MTOProgress.__table__), progress_list)
             session.commit()
         except Exception as e:
             session.rollback()
@@ -1168,11 +1355,12 @@ class DataManager:
         """تمام شماره خط‌های متمایز برای یک پروژه را برمی‌گرداند."""
         session = self.get_session()
         try:
-            # از جدول MTOItem شماره خطوط را می‌خوانیم
+            # از جدول MTOItem شماره خطوط را می‌خوانیم؛ DISTINCT و مرتب‌سازی در SQLite و فقط از روی
+            # ایندکس ix_mto_items_project_line انجام می‌شود
             lines = session.query(MTOItem.line_no).filter(MTOItem.project_id == project_id).distinct().order_by(
                 MTOItem.line_no).all()
             # نتیجه کوئری لیستی از tupleهاست، آن را به لیست رشته تبدیل می‌کنیم
-            return [line[0] for line in lines]
+            return [line_no for (line_no,) in lines]
         except Exception as e:
             logging.error(f"Error fetching lines for project {project_id}: {e}")
             return []
@@ -1194,6 +1382,34 @@ class DataManager:
         finally:
             session.close()
 
+    _ACTIVITY_LOG_ROWS_SQL = (
+        "SELECT strftime('%Y-%m-%d %H:%M:%S', timestamp) AS timestamp, user, action, details "
+        "FROM activity_logs ORDER BY activity_logs.timestamp DESC LIMIT :limit"
+    )
+
+    def get_activity_log_rows(self, limit=100) -> List[Dict[str, Any]]:
+        """
+        آخرین N لاگ فعالیت را به صورت دیکشنری‌های آماده برای JSON برمی‌گرداند.
+        قالب‌بندی تاریخ در خود SQLite انجام می‌شود تا برای هر ردیف آبجکت datetime ساخته نشود.
+        """
+        return list(self.iter_activity_log_rows(limit))
+
+    def iter_activity_log_rows(self, limit=100, batch_size=500):
+        """
+        نسخه generator از get_activity_log_rows: ردیف‌ها دسته‌دسته از cursor خوانده و تحویل داده می‌شوند،
+        پس حافظه مصرفی به limit وابسته نیست. سشن تا پایان پیمایش باز می‌ماند.
+        """
+        session = self.get_session()
+        try:
+            result = session.execute(text(self._ACTIVITY_LOG_ROWS_SQL), {"limit": limit})
+            for batch in result.mappings().partitions(batch_size):
+                for row in batch:
+                    yield dict(row)
+        except Exception as e:
+            logging.error(f"Error fetching activity log rows: {e}")
+        finally:
+            session.close()
+
     def get_project_analytics(self, project_id):
         """داده‌های تحلیلی و آماری یک پروژه را برای داشبورد استخراج می‌کند."""
         session = self.get_session()
@@ -1235,78 +1451,96 @@ class DataManager:
     # متدهای لازم برای گذارش گیری
     # --------------------------------------------------------------------
 
+    # ستون‌های گزارش MTO Summary یک بار هنگام تعریف کلاس ساخته می‌شوند؛
+    # مرتب‌سازی هم فقط از طریق همین دیکشنری (نام ستون خروجی -> ستون کوئری) به ORDER BY می‌رسد.
+    _MTO_TOTAL_REQUIRED = func.coalesce(func.sum(MTOProgress.total_qty), 0)
+    _MTO_TOTAL_USED = func.coalesce(func.sum(MTOProgress.used_qty), 0)
+    _MTO_PROGRESS = case((_MTO_TOTAL_REQUIRED > 0, _MTO_TOTAL_USED * 100.0 / _MTO_TOTAL_REQUIRED), else_=0)
+    _MTO_SUMMARY_COLUMNS = {
+        "Item Code": MTOProgress.item_code.label("item_code"),
+        "Description": MTOProgress.description.label("description"),
+        "Unit": MTOProgress.unit.label("unit"),
+        "Total Required": _MTO_TOTAL_REQUIRED.label("total_required"),
+        "Total Used": _MTO_TOTAL_USED.label("total_used"),
+        "Remaining": (_MTO_TOTAL_REQUIRED - _MTO_TOTAL_USED).label("remaining"),
+        "Progress (%)": _MTO_PROGRESS.label("progress"),
+    }
+
     def get_project_mto_summary(self, project_id: int, **filters) -> Dict[str, Any]:
         """
         --- CHANGE: بازنویسی کامل برای افزودن فیلترهای پیشرفته و خلاصه‌سازی ---
         گزارش خلاصه پیشرفت متریال (MTO Summary) را برای کل پروژه تولید می‌کند.
+        فیلتر، بازه پیشرفت، مرتب‌سازی و صفحه‌بندی همگی در خود SQL انجام می‌شوند.
         """
         session = self.get_session()
         try:
-            # کوئری پایه برای جمع‌بندی پیشرفت در سطح پروژه
-            summary_query = session.query(
-                MTOProgress.item_code,
-                MTOProgress.description,
-                MTOProgress.unit,
-                func.sum(MTOProgress.total_qty).label("total_required"),
-                func.sum(MTOProgress.used_qty).label("total_used")
-            ).filter(MTOProgress.project_id == project_id).group_by(
-                MTOProgress.item_code, MTOProgress.description, MTOProgress.unit
-            )
-
-            # --- Filters ---
+            # --- Filters (روی ردیف‌ها، پیش از گروه‌بندی) ---
+            conditions = [MTOProgress.project_id == project_id]
             if filters.get('item_code'):
-                summary_query = summary_query.filter(MTOProgress.item_code.ilike(f"%{filters['item_code']}%"))
+                conditions.append(MTOProgress.item_code.ilike(f"%{filters['item_code']}%"))
             if filters.get('description'):
-                summary_query = summary_query.filter(MTOProgress.description.ilike(f"%{filters['description']}%"))
+                conditions.append(MTOProgress.description.ilike(f"%{filters['description']}%"))
 
-            # اجرای کوئری برای گرفتن تمام نتایج فیلتر شده
-            all_results = summary_query.all()
+            # جمع کل پروژه (بدون اعمال فیلتر پیشرفت، مانند قبل)
+            grand_required, grand_used = session.query(
+                self._MTO_TOTAL_REQUIRED, self._MTO_TOTAL_USED
+            ).filter(*conditions).one()
 
-            report_data = []
-            total_required_sum = 0
-            total_used_sum = 0
+            # کوئری پایه برای جمع‌بندی پیشرفت در سطح پروژه
+            summary_query = session.query(*self._MTO_SUMMARY_COLUMNS.values()).filter(*conditions).group_by(
+                MTOProgress.item_code, MTOProgress.description, MTOProgress.unit
+            )
 
-            for row in all_results:
-                total_required_sum += row.total_required
-                total_used_sum += row.total_used
-                remaining = row.total_required - row.total_used
-                progress = (row.total_used / row.total_required * 100) if row.total_required > 0 else 0
+            # فیلترهای پیشرفت روی مقدار تجمیعی (HAVING)
+            min_progress = filters.get('min_progress')
+            max_progress = filters.get('max_progress')
+            if min_progress is not None:
+                summary_query = summary_query.having(self._MTO_PROGRESS >= min_progress)
+            if max_progress is not None:
+                summary_query = summary_query.having(self._MTO_PROGRESS <= max_progress)
+
+            # مرتب‌سازی (فقط ستون‌های مجاز؛ پیش‌فرض Item Code)؛ کلید گروه به‌عنوان معیار دوم
+            # ترتیب ردیف‌های هم‌مقدار را ثابت نگه می‌دارد تا صفحه‌های OFFSET/LIMIT هم‌پوشانی یا جاافتادگی نداشته باشند
+            sort_col = self._MTO_SUMMARY_COLUMNS.get(filters.get('sort_by'), self._MTO_SUMMARY_COLUMNS["Item Code"])
+            direction = desc if filters.get('sort_order', 'asc') == 'desc' else asc
+            summary_query = summary_query.order_by(
+                direction(sort_col), MTOProgress.item_code, MTOProgress.description, MTOProgress.unit
+            )
 
-                # فیلترهای بعد از محاسبه (برای پیشرفت)
-                min_progress = filters.get('min_progress')
-                max_progress = filters.get('max_progress')
-                if (min_progress is not None and progress < min_progress) or \
-                        (max_progress is not None and progress > max_progress):
-                    continue
+            # --- Pagination (اختیاری؛ بدون page/per_page کل داده برگردانده می‌شود) ---
+            page, per_page = filters.get('page'), filters.get('per_page')
+            pagination = None
+            if page or per_page:
+                total_items = summary_query.order_by(None).count()
+                pagination, start, end = self._pagination_info(total_items, page, per_page)
+                summary_query = summary_query.offset(start).limit(end - start)
 
-                report_data.append({
+            report_data = [
+                {
                     "Item Code": row.item_code or "N/A",
                     "Description": row.description,
                     "Unit": row.unit,
                     "Total Required": round(row.total_required, 2),
                     "Total Used": round(row.total_used, 2),
-                    "Remaining": round(remaining, 2),
-                    "Progress (%)": round(progress, 2)
-                })
-
-            # مرتب‌سازی نهایی
-            sort_by = filters.get('sort_by', 'Item Code')
-            sort_order = filters.get('sort_order', 'asc')
-            reverse = sort_order == 'desc'
-            if sort_by in report_data[0]:
-                report_data.sort(key=lambda x: x[sort_by], reverse=reverse)
+                    "Remaining": round(row.remaining, 2),
+                    "Progress (%)": round(row.progress, 2)
+                }
+                for row in summary_query.all()
+            ]
 
             # ساخت دیکشنری خروجی نهایی
             output = {
                 "summary": {
-                    "total_unique_items": len(report_data),
-                    "grand_total_required": round(total_required_sum, 2),
-                    "grand_total_used": round(total_used_sum, 2),
+                    "total_unique_items": pagination["total_records"] if pagination else len(report_data),
+                    "grand_total_required": round(grand_required, 2),
+                    "grand_total_used": round(grand_used, 2),
                     "overall_progress": round(
-                        (total_used_sum / total_required_sum * 100) if total_required_sum > 0 else 0, 2)
+                        (grand_used / grand_required * 100) if grand_required > 0 else 0, 2)
                 },
                 "data": report_data
             }
+            if pagination:
+                output["pagination"] = pagination
             return output
 
         except Exception as e:
@@ -1315,20 +1549,50 @@ class DataManager:
         finally:
             session.close()
 
-    def get_project_line_status_list(self, project_id: int) -> List[Dict[str, Any]]:
+    DEFAULT_PER_PAGE = 50
+    MAX_PER_PAGE = 1000
+
+    def _pagination_info(self, total_records: int, page=None, per_page=None):
+        """
+        اطلاعات صفحه‌بندی و بازه [start, end) ردیف‌های صفحه درخواستی را برمی‌گرداند.
+        مقادیر نامعتبر به نزدیک‌ترین مقدار مجاز اصلاح می‌شوند.
+        """
+        per_page = min(max(per_page or self.DEFAULT_PER_PAGE, 1), self.MAX_PER_PAGE)
+        page = max(page or 1, 1)
+        start = (page - 1) * per_page
+        info = {
+            "total_records": total_records,
+            "total_pages": (total_records + per_page - 1) // per_page,
+            "current_page": page,
+            "per_page": per_page
+        }
+        return info, start, start + per_page
+
+    def get_project_line_status_list(self, project_id: int, page: int = None, per_page: int = None):
         """
         گزارش لیست وضعیت خطوط (Line Status List) را برای یک پروژه تولید می‌کند.
+        - اگر page یا per_page داده شود، فقط خطوط همان صفحه محاسبه می‌شوند و خروجی به شکل
+          {"pagination": ..., "data": [...]} است؛ در غیر این صورت لیست کامل (مانند قبل) برگردانده می‌شود.
         """
         session = self.get_session()
         try:
             lines = self.get_lines_for_project(project_id)
+            pagination = None
+            if page or per_page:
+                # صفحه‌بندی پیش از محاسبه پیشرفت، تا کار دیتابیس فقط برای خطوط همین صفحه انجام شود
+                pagination, start, end = self._pagination_info(len(lines), page, per_page)
+                lines = lines[start:end]
+            # آخرین فعالیت همه خطوط با یک کوئری گروه‌بندی‌شده (به جای یک کوئری برای هر خط)
+            last_activity_by_line = dict(
+                session.query(MIVRecord.line_no, func.max(MIVRecord.last_updated))
+                .filter(MIVRecord.project_id == project_id)
+                .group_by(MIVRecord.line_no)
+                .all()
+            )
             report_data = []
             for line_no in lines:
                 progress_info = self.get_line_progress(project_id, line_no)
-                last_activity = session.query(func.max(MIVRecord.last_updated)).filter(
-                    MIVRecord.project_id == project_id,
-                    MIVRecord.line_no == line_no
-                ).scalar()
+                last_activity = last_activity_by_line.get(line_no)
 
                 status = "Complete" if progress_info.get("percentage", 0) >= 99.99 else "In-Progress"
 
@@ -1338,7 +1602,10 @@ class DataManager:
                     "Status": status,
                     "Last Activity Date": last_activity.strftime('%Y-%m-%d') if last_activity else "N/A"
                 })
-            return sorted(report_data, key=lambda x: x['Line No'])
+            report_data.sort(key=lambda x: x['Line No'])
+            if pagination is not None:
+                return {"pagination": pagination, "data": report_data}
+            return report_data
         except Exception as e:
             logging.error(f"Error in get_project_line_status_list: {e}")
             return []
@@ -1534,80 +1801,87 @@ class DataManager:
         finally:
             session.close()
 
+    # بازه‌های نمودار توزیع پیشرفت: [0,25) [25,50) [50,75) [75,100) و 100 به بالا
+    _PROGRESS_BIN_EDGES = np.array([25.0, 50.0, 75.0, 100.0])
+    _PROGRESS_BIN_LABELS = ("0-25%", "25-50%", "50-75%", "75-99%", "100%")
+
+    # گزارش اول: توزیع پیشرفت خطوط (برای نمودار میله‌ای یا دایره‌ای)
+    def _analytics_line_progress_distribution(self, session, project_id: int, **params) -> Dict[str, Any]:
+        lines = self.get_project_line_status_list(project_id)
+        progresses = np.fromiter((line['Progress (%)'] for line in lines), dtype=np.float64, count=len(lines))
+        # شماره بازه هر خط با یک جستجوی دودویی برداری روی مرزها؛ سپس شمارش هر بازه با bincount
+        bin_index = np.searchsorted(self._PROGRESS_BIN_EDGES, progresses, side='right')
+        counts = np.bincount(bin_index, minlength=len(self._PROGRESS_BIN_LABELS))
+
+        return {
+            "title": "توزیع پیشرفت خطوط",
+            "type": "bar",
+            "data": {
+                "labels": list(self._PROGRESS_BIN_LABELS),
+                "datasets": [{"label": "تعداد خطوط", "data": counts.tolist()}]
+            }
+        }
+
+    # گزارش دوم: مصرف متریال بر اساس نوع (برای نمودار دایره‌ای)
+    def _analytics_material_usage_by_type(self, session, project_id: int, **params) -> Dict[str, Any]:
+        query = session.query(
+            MTOItem.item_type,
+            func.sum(MTOProgress.used_qty).label('total_used')
+        ).join(MTOProgress, MTOItem.id == MTOProgress.mto_item_id) \
+            .filter(MTOProgress.project_id == project_id, MTOItem.item_type != None) \
+            .group_by(MTOItem.item_type).order_by(desc('total_used')).limit(10)
+
+        results = query.all()
+        return {
+            "title": "۱۰ نوع متریال پر مصرف",
+            "type": "pie",
+            "data": {
+                "labels": [r.item_type for r in results],
+                "datasets": [{"data": [round(r.total_used, 2) for r in results]}]
+            }
+        }
+
+    # گزارش سوم: تاریخچه مصرف در طول زمان (برای نمودار خطی)
+    def _analytics_consumption_over_time(self, session, project_id: int, **params) -> Dict[str, Any]:
+        # این گزارش سراسری است و به پروژه وابسته نیست
+        query = session.query(
+            func.strftime('%Y-%m-%d', SpoolConsumption.timestamp).label('date'),
+            func.count(SpoolConsumption.id).label('consumption_count')
+        ).group_by('date').order_by('date')
+
+        results = query.all()
+        return {
+            "title": "تعداد آیتم‌های مصرفی از انبار اسپول در طول زمان",
+            "type": "line",
+            "data": {
+                "labels": [r.date for r in results],
+                "datasets": [{"label": "تعداد مصرف", "data": [r.consumption_count for r in results]}]
+            }
+        }
+
+    # جدول ثابت نام گزارش -> تابع سازنده؛ یک بار در تعریف کلاس ساخته می‌شود و
+    # انتخاب گزارش با یک جستجوی دیکشنری انجام می‌شود (به‌جای زنجیره if/elif).
+    ANALYTICS_HANDLERS = {
+        'line_progress_distribution': _analytics_line_progress_distribution,
+        'material_usage_by_type': _analytics_material_usage_by_type,
+        'consumption_over_time': _analytics_consumption_over_time,
+    }
+
     def get_report_analytics(self, project_id: int, report_name: str, **params) -> Dict[str, Any]:
         """
         --- NEW: متد جدید و قدرتمند برای تولید داده‌های تحلیلی و آماری برای نمودارها ---
+        در صورت خطا دیکشنری شامل 'error' و 'status_code' برمی‌گرداند.
         """
+        handler = self.ANALYTICS_HANDLERS.get(report_name)
+        if handler is None:
+            return {"error": "Report name not found", "status_code": 404}
+
         session = self.get_session()
         try:
-            # گزارش اول: توزیع پیشرفت خطوط (برای نمودار میله‌ای یا دایره‌ای)
-            if report_name == 'line_progress_distribution':
-                lines = self.get_project_line_status_list(project_id)
-                bins = {"0-25%": 0, "25-50%": 0, "50-75%": 0, "75-99%": 0, "100%": 0}
-                for line in lines:
-                    p = line['Progress (%)']
-                    if p < 25:
-                        bins["0-25%"] += 1
-                    elif p < 50:
-                        bins["25-50%"] += 1
-                    elif p < 75:
-                        bins["50-75%"] += 1
-                    elif p < 100:
-                        bins["75-99%"] += 1
-                    else:
-                        bins["100%"] += 1
-
-                return {
-                    "title": "توزیع پیشرفت خطوط",
-                    "type": "bar",
-                    "data": {
-                        "labels": list(bins.keys()),
-                        "datasets": [{"label": "تعداد خطوط", "data": list(bins.values())}]
-                    }
-                }
-
-            # گزارش دوم: مصرف متریال بر اساس نوع (برای نمودار دایره‌ای)
-            elif report_name == 'material_usage_by_type':
-                query = session.query(
-                    MTOItem.item_type,
-                    func.sum(MTOProgress.used_qty).label('total_used')
-                ).join(MTOProgress, MTOItem.id == MTOProgress.mto_item_id) \
-                    .filter(MTOProgress.project_id == project_id, MTOItem.item_type != None) \
-                    .group_by(MTOItem.item_type).order_by(desc('total_used')).limit(10)
-
-                results = query.all()
-                return {
-                    "title": "۱۰ نوع متریال پر مصرف",
-                    "type": "pie",
-                    "data": {
-                        "labels": [r.item_type for r in results],
-                        "datasets": [{"data": [round(r.total_used, 2) for r in results]}]
-                    }
-                }
-
-            # گزارش سوم: تاریخچه مصرف در طول زمان (برای نمودار خطی)
-            elif report_name == 'consumption_over_time':
-                # این گزارش سراسری است و به پروژه وابسته نیست
-                query = session.query(
-                    func.strftime('%Y-%m-%d', SpoolConsumption.timestamp).label('date'),
-                    func.count(SpoolConsumption.id).label('consumption_count')
-                ).group_by('date').order_by('date')
-
-                results = query.all()
-                return {
-                    "title": "تعداد آیتم‌های مصرفی از انبار اسپول در طول زمان",
-                    "type": "line",
-                    "data": {
-                        "labels": [r.date for r in results],
-                        "datasets": [{"label": "تعداد مصرف", "data": [r.consumption_count for r in results]}]
-                    }
-                }
-
-            return {"error": "Report name not found"}, 404
-
+            return handler(self, session, project_id, **params)
         except Exception as e:
             logging.error(f"Error in get_report_analytics: {e}")
-            return {"error": str(e)}, 500
+            return {"error": str(e), "status_code": 500}
         finally:
             session.close()
 
@@ -1763,6 +2037,20 @@ class DataManager:
     # متدهای لازم برای  مدیریت اسپول ها
     # --------------------------------------------------------------------
 
+    _SPOOL_ITEM_FIELDS = ("component_type", "class_angle", "p1_bore", "p2_bore", "material",
+                          "schedule", "length", "qty_available", "item_code")
+
+    def _bulk_insert_spool_items(self, session, spool_pk: int, items_data: list[dict]):
+        """
+        آیتم‌های یک اسپول را با یک دستور INSERT چندردیفی (executemany) ثبت می‌کند.
+        - به جای ساخت یک شیء ORM و یک INSERT برای هر ردیف، یک statement آماده برای همه ردیف‌ها اجرا می‌شود.
+        """
+        if not items_data:
+            return  # اجرای insert با لیست خالی یک ردیف پیش‌فرض درج می‌کند
+        rows = [{"spool_id_fk": spool_pk, **{f: item.get(f) for f in self._SPOOL_ITEM_FIELDS}}
+                for item in items_data]
+        session.execute(insert(SpoolItem.__table__), rows)
+
     def create_spool(self, spool_data: dict, items_data: list[dict]) -> Tuple[bool, str]:
         """
         یک اسپول جدید همراه با آیتم‌هایش ایجاد می‌کند.
@@ -1783,20 +2071,7 @@ class DataManager:
             session.add(new_spool)
             session.flush()  # برای گرفتن ID اسپول جدید
 
-            for item in items_data:
-                new_item = SpoolItem(
-                    spool_id_fk=new_spool.id,
-                    component_type=item.get("component_type"),
-                    class_angle=item.get("class_angle"),
-                    p1_bore=item.get("p1_bore"),
-                    p2_bore=item.get("p2_bore"),
-                    material=item.get("material"),
-                    schedule=item.get("schedule"),
-                    length=item.get("length"),
-                    qty_available=item.get("qty_available"),
-                    item_code=item.get("item_code")
-                )
-                session.add(new_item)
+            self._bulk_insert_spool_items(session, new_spool.id, items_data)
 
             session.commit()
             return True, f"اسپول '{new_spool.spool_id}' با موفقیت ساخته شد."
@@ -1828,20 +2103,7 @@ class DataManager:
             session.flush()
 
             # افزودن آیتم‌های جدید
-            for item in items_data:
-                new_item = SpoolItem(
-                    spool_id_fk=spool.id,
-                    component_type=item.get("component_type"),
-                    class_angle=item.get("class_angle"),
-                    p1_bore=item.get("p1_bore"),
-                    p2_bore=item.get("p2_bore"),
-                    material=item.get("material"),
-                    schedule=item.get("schedule"),
-                    length=item.get("length"),
-                    qty_available=item.get("qty_available"),
-                    item_code=item.get("item_code")
-                )
-                session.add(new_item)
+            self._bulk_insert_spool_items(session, spool.id, items_data)
 
             session.commit()
             return True, f"اسپول '{spool_id}' با موفقیت ویرایش شد."
@@ -1951,10 +2213,49 @@ class DataManager:
             session.flush()  # برای گرفتن شناسه پروژه جدید
         return project
 
+    # سقف پیش‌فرض تعداد پارامترهای یک دستور در SQLite (نسخه‌های قدیمی‌تر از 3.32)
+    _SQLITE_MAX_VARIABLES = 999
+    # تعداد ردیف‌های هر تکه هنگام خواندن فایل‌های بزرگ CSV
+    CSV_CHUNK_ROWS = 10_000
+
+    def _append_dataframe(self, session, df: pd.DataFrame, table) -> int:
+        """
+        یک DataFrame را بدون ساخت دیکشنری یا آبجکت ORM برای هر ردیف، مستقیماً در جدول درج می‌کند.
+        - درج با INSERT چندردیفی انجام می‌شود و اندازه هر دسته طوری است که از سقف پارامترهای SQLite بیشتر نشود.
+        - روی اتصال همان session اجرا می‌شود تا داخل تراکنش جاری بماند.
+        """
+        if df.empty:
+            return 0
+        rows_per_chunk = max(1, self._SQLITE_MAX_VARIABLES // len(df.columns))
+        df.to_sql(table.name, session.connection(), if_exists='append', index=False,
+                  method='multi', chunksize=rows_per_chunk)
+        return len(df)
+
     def update_project_mto_from_csv(self, project_name: str, mto_file_path: str) -> Tuple[bool, str]:
         """
         --- CHANGE: استفاده از تابع نرمال‌سازی جدید برای انعطاف‌پذیری بیشتر ---
         """
+        session = self.get_session()
+        try:
+            with session.begin():
+                self._replace_project_mto(session, project_name, mto_file_path)
+            return True, f"✔ داده‌های MTO برای پروژه '{project_name}' با موفقیت به‌روزرسانی شدند."
+
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            logging.error(f"شکست در آپدیت MTO برای {project_name}: {e}")
+            return False, f"خطا در فایل MTO پروژه '{project_name}': {e}"
+        except Exception as e:
+            logging.error(f"An unexpected error occurred during MTO update for {project_name}: {e}")
+            return False, f"خطای غیرمنتظره در آپدیت MTO پروژه '{project_name}': {e}"
+        finally:
+            session.close()
+
+    def _replace_project_mto(self, session, project_name: str, mto_file_path: str) -> int:
+        """
+        داده‌های MTO یک پروژه را داخل تراکنش session داده‌شده با محتوای فایل CSV جایگزین می‌کند.
+        - commit نمی‌کند؛ فراخواننده تراکنش را مدیریت می‌کند. لاگ‌ها هم در همان تراکنش ثبت می‌شوند.
+        - تعداد آیتم‌های درج‌شده را برمی‌گرداند.
+        """
         # --- CHANGE: تعریف نگاشت بر اساس نام‌های نرمال‌شده و ستون‌های ضروری دیتابیس ---
         REQUIRED_DB_COLS = {'line_no', 'description'}
         MTO_COLUMN_MAP = {
@@ -1964,115 +2265,139 @@ class DataManager:
             'LENGTHM': 'length_m', 'QUANTITY': 'quantity', 'JOINT': 'joint', 'INCHDIA': 'inch_dia'
         }
 
-        session = self.get_session()
-        try:
-            with session.begin():
-                self.log_activity("system", "MTO_UPDATE_START", f"شروع آپدیت MTO برای پروژه '{project_name}'.", session)
-
-                project = self.get_or_create_project(session, project_name)
-                project_id = project.id
+        self.log_activity("system", "MTO_UPDATE_START", f"شروع آپدیت MTO برای پروژه '{project_name}'.", session)
 
-                # خواندن و پردازش DataFrame با تابع جدید
-                mto_df_raw = pd.read_csv(mto_file_path, dtype=str).fillna('')
-                mto_df = self._normalize_and_rename_df(
-                    mto_df_raw, MTO_COLUMN_MAP, REQUIRED_DB_COLS, os.path.basename(mto_file_path)
-                )
-                mto_df['project_id'] = project_id
+        project = self.get_or_create_project(session, project_name)
+        project_id = project.id
 
-                # تبدیل ستون‌های عددی
-                for col in ['p1_bore_in', 'p2_bore_in', 'p3_bore_in', 'length_m', 'quantity', 'joint', 'inch_dia']:
-                     if col in mto_df.columns:
-                        mto_df[col] = pd.to_numeric(mto_df[col], errors='coerce')
+        file_name = os.path.basename(mto_file_path)
 
+        # ابتدا فقط سرستون‌ها را می‌خوانیم تا پیش از حذف داده‌های قدیمی، ستون‌های ضروری بررسی شوند
+        self._normalize_and_rename_df(
+            pd.read_csv(mto_file_path, dtype=str, nrows=0), MTO_COLUMN_MAP, REQUIRED_DB_COLS, file_name
+        )
 
-                # حذف داده‌های قدیمی (بدون تغییر)
-                mto_item_ids_to_delete = session.query(MTOItem.id).filter(MTOItem.project_id == project_id).scalar_subquery()
-                session.query(MTOConsumption).filter(MTOConsumption.mto_item_id.in_(mto_item_ids_to_delete)).delete(synchronize_session=False)
-                session.query(MTOProgress).filter(MTOProgress.project_id == project_id).delete(synchronize_session=False)
-                session.query(MTOItem).filter(MTOItem.project_id == project_id).delete(synchronize_session=False)
-                session.flush()
+        # حذف داده‌های قدیمی (بدون تغییر)
+        mto_item_ids_to_delete = session.query(MTOItem.id).filter(MTOItem.project_id == project_id).scalar_subquery()
+        session.query(MTOConsumption).filter(MTOConsumption.mto_item_id.in_(mto_item_ids_to_delete)).delete(synchronize_session=False)
+        session.query(MTOProgress).filter(MTOProgress.project_id == project_id).delete(synchronize_session=False)
+        session.query(MTOItem).filter(MTOItem.project_id == project_id).delete(synchronize_session=False)
+        session.flush()
+
+        # فایل به صورت تکه‌تکه خوانده و درج می‌شود تا حافظه مصرفی به اندازه فایل وابسته نباشد
+        inserted = 0
+        for mto_df_raw in pd.read_csv(mto_file_path, dtype=str, chunksize=self.CSV_CHUNK_ROWS):
+            mto_df = self._normalize_and_rename_df(
+                mto_df_raw.fillna(''), MTO_COLUMN_MAP, REQUIRED_DB_COLS, file_name
+            )
+            mto_df['project_id'] = project_id
 
-                # درج داده‌های جدید
-                mto_records = mto_df.to_dict(orient='records')
-                if mto_records:
-                    session.bulk_insert_mappings(MTOItem, mto_records)
+            # تبدیل ستون‌های عددی (یک‌جا و برداری)
+            numeric_cols = mto_df.columns.intersection(
+                ['p1_bore_in', 'p2_bore_in', 'p3_bore_in', 'length_m', 'quantity', 'joint', 'inch_dia'])
+            mto_df[numeric_cols] = mto_df[numeric_cols].apply(pd.to_numeric, errors='coerce')
 
-            self.log_activity("system", "MTO_UPDATE_SUCCESS", f"{len(mto_df)} آیتم MTO برای '{project_name}' آپدیت شد.")
-            return True, f"✔ داده‌های MTO برای پروژه '{project_name}' با موفقیت به‌روزرسانی شدند."
+            # درج داده‌های جدید مستقیماً از DataFrame
+            inserted += self._append_dataframe(session, mto_df, MTOItem.__table__)
 
-        except (ValueError, KeyError, FileNotFoundError) as e:
-            session.rollback()
-            logging.error(f"شکست در آپدیت MTO برای {project_name}: {e}")
-            return False, f"خطا در فایل MTO پروژه '{project_name}': {e}"
-        except Exception as e:
-            session.rollback()
-            logging.error(f"An unexpected error occurred during MTO update for {project_name}: {e}")
-            return False, f"خطای غیرمنتظره در آپدیت MTO پروژه '{project_name}': {e}"
-        finally:
-            session.close()
+        self.log_activity("system", "MTO_UPDATE_SUCCESS", f"{inserted} آیتم MTO برای '{project_name}' آپدیت شد.", session)
+        return inserted
 
-    def process_selected_csv_files(self, file_paths: List[str]) -> Tuple[bool, str]:
+    def process_selected_csv_files(self, file_paths: List[str], progress_callback=None) -> Tuple[bool, str]:
         """
         --- NEW: تابع جدید برای پردازش هوشمند فایل‌های CSV انتخاب شده ---
         فایل‌ها را دسته‌بندی کرده و عملیات آپدیت مربوطه (MTO یا Spool) را اجرا می‌کند.
-        """
+        - همه فایل‌ها در یک تراکنش واحد اعمال می‌شوند: یا همه ذخیره می‌شوند یا در صورت خطا هیچ‌کدام.
+        - progress_callback (اختیاری) پس از هر مرحله (Spool یا هر پروژه MTO) با درصد پیشرفت 0 تا 100 صدا زده می‌شود.
+        """
+        # دسته‌بندی فایل‌های انتخاب شده
+        mto_files = {}
+        spool_file = None
+        spool_items_file = None
+
+        for path in file_paths:
+            filename = os.path.basename(path)
+            if filename.upper().startswith("MTO-") and filename.upper().endswith(".CSV"):
+                project_name = filename.replace("MTO-", "").replace(".csv", "")
+                mto_files[project_name] = path
+            elif filename.upper() == "SPOOLS.CSV":
+                spool_file = path
+            elif filename.upper() == "SPOOLITEMS.CSV":
+                spool_items_file = path
+
+        # بررسی شرایط لازم برای هر نوع آپدیت
+        can_update_spool = spool_file and spool_items_file
+        can_update_mto = bool(mto_files)
+
+        if not can_update_spool and not can_update_mto:
+            return False, "هیچ فایل معتبری انتخاب نشد.\nبرای آپدیت MTO، نام فایل باید `MTO-ProjectName.csv` باشد.\nبرای آپدیت Spool، هر دو فایل `Spools.csv` و `SpoolItems.csv` باید انتخاب شوند."
+
+        summary_log = []
+        total_steps = (1 if can_update_spool else 0) + len(mto_files)
+        done_steps = 0
+        current_step = "Spool"
+
+        def report_step():
+            nonlocal done_steps
+            done_steps += 1
+            if progress_callback:
+                progress_callback(int(done_steps * 100 / total_steps))
+
+        session = self.get_session()
         try:
-            # دسته‌بندی فایل‌های انتخاب شده
-            mto_files = {}
-            spool_file = None
-            spool_items_file = None
-
-            for path in file_paths:
-                filename = os.path.basename(path)
-                if filename.upper().startswith("MTO-") and filename.upper().endswith(".CSV"):
-                    project_name = filename.replace("MTO-", "").replace(".csv", "")
-                    mto_files[project_name] = path
-                elif filename.upper() == "SPOOLS.CSV":
-                    spool_file = path
-                elif filename.upper() == "SPOOLITEMS.CSV":
-                    spool_items_file = path
-
-            # بررسی شرایط لازم برای هر نوع آپدیت
-            can_update_spool = spool_file and spool_items_file
-            can_update_mto = bool(mto_files)
-
-            if not can_update_spool and not can_update_mto:
-                return False, "هیچ فایل معتبری انتخاب نشد.\nبرای آپدیت MTO، نام فایل باید `MTO-ProjectName.csv` باشد.\nبرای آپدیت Spool، هر دو فایل `Spools.csv` و `SpoolItems.csv` باید انتخاب شوند."
-
-            summary_log = []
-
-            # ۱. آپدیت داده‌های Spool (اگر هر دو فایل انتخاب شده باشند)
-            # این عملیات اول انجام می‌شود چون ممکن است MTO به آن وابسته باشد.
-            if can_update_spool:
-                logging.info("Processing Spool files...")
-                success, message = self.replace_all_spool_data(spool_file, spool_items_file)
-                if not success:
-                    # اگر آپدیت اسپول شکست بخورد، کل عملیات متوقف می‌شود
-                    return False, f"خطا در به‌روزرسانی Spool: {message}"
-                summary_log.append(message)
-
-            # ۲. آپدیت داده‌های MTO (برای هر فایل MTO به صورت مجزا)
-            if can_update_mto:
+            with session.begin():
+                # ۱. آپدیت داده‌های Spool (اگر هر دو فایل انتخاب شده باشند)
+                # این عملیات اول انجام می‌شود چون ممکن است MTO به آن وابسته باشد.
+                if can_update_spool:
+                    logging.info("Processing Spool files...")
+                    self._replace_spool_data(session, spool_file, spool_items_file)
+                    summary_log.append("✔ داده‌های Spool با موفقیت به صورت کامل جایگزین شدند.")
+                    report_step()
+
+                # ۲. آپدیت داده‌های MTO (برای هر فایل MTO به صورت مجزا)
                 for project_name, mto_path in sorted(mto_files.items()):
+                    current_step = f"پروژه '{project_name}'"
                     logging.info(f"Processing MTO file for project '{project_name}'...")
-                    success, message = self.update_project_mto_from_csv(project_name, mto_path)
-                    if not success:
-                        # اگر آپدیت یک پروژه شکست بخورد، کل عملیات متوقف می‌شود
-                        error_msg = f"خطا در آپدیت پروژه '{project_name}': {message}. عملیات متوقف شد."
-                        return False, error_msg
-                    summary_log.append(message)
+                    self._replace_project_mto(session, project_name, mto_path)
+                    summary_log.append(f"✔ داده‌های MTO برای پروژه '{project_name}' با موفقیت به‌روزرسانی شدند.")
+                    report_step()
 
             return True, "\n".join(summary_log)
 
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            # اگر یک مرحله شکست بخورد، کل تراکنش برگردانده می‌شود و هیچ تغییری ذخیره نمی‌شود
+            logging.error(f"CSV update failed at {current_step}: {e}")
+            return False, f"خطا در فایل‌های {current_step}: {e}. عملیات متوقف شد و هیچ تغییری ذخیره نشد."
         except Exception as e:
             import traceback
             logging.error(f"An unexpected error occurred in process_selected_csv_files: {traceback.format_exc()}")
-            return False, f"یک خطای پیش‌بینی نشده در پردازش فایل‌ها رخ داد: {e}"
+            return False, f"یک خطای پیش‌بینی نشده در پردازش {current_step} رخ داد: {e}. هیچ تغییری ذخیره نشد."
+        finally:
+            session.close()
 
     def replace_all_spool_data(self, spool_file_path: str, spool_items_file_path: str) -> Tuple[bool, str]:
         """
         --- CHANGE: استفاده از تابع نرمال‌سازی جدید برای انعطاف‌پذیری بیشتر ---
         """
+        session = self.get_session()
+        try:
+            with session.begin():
+                self._replace_spool_data(session, spool_file_path, spool_items_file_path)
+            return True, "✔ داده‌های Spool با موفقیت به صورت کامل جایگزین شدند."
+
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            return False, f"خطا در فایل‌های Spool: {e}"
+        except Exception as e:
+            return False, f"خطای دیتابیس در جایگزینی Spool: {e}. (ممکن است رکوردهای مصرفی مانع حذف شده باشند)"
+        finally:
+            session.close()
+
+    def _replace_spool_data(self, session, spool_file_path: str, spool_items_file_path: str) -> Tuple[int, int]:
+        """
+        تمام داده‌های Spool را داخل تراکنش session داده‌شده با محتوای دو فایل CSV جایگزین می‌کند.
+        - commit نمی‌کند؛ فراخواننده تراکنش را مدیریت می‌کند.
+        - تعداد اسپول‌ها و آیتم‌های اسپول درج‌شده را برمی‌گرداند.
+        """
         # --- CHANGE: تعریف نگاشت بر اساس نام‌های نرمال‌شده و ستون‌های ضروری دیتابیس ---
         REQUIRED_SPOOL_DB_COLS = {"spool_id"}
         REQUIRED_SPOOL_ITEM_DB_COLS = {"spool_id_str", "component_type"}
@@ -2085,60 +2410,47 @@ class DataManager:
             "P1BORE": "p1_bore", "P2BORE": "p2_bore", "MATERIAL": "material", "SCHEDULE": "schedule",
             "THICKNESS": "thickness", "LENGTH": "length", "QTYAVAILABLE": "qty_available", "ITEMCODE": "item_code"
         }
-        session = self.get_session()
-        try:
-            with session.begin():
-                # پردازش فایل Spools.csv
-                spools_df_raw = pd.read_csv(spool_file_path, dtype=str).fillna('')
-                spools_df = self._normalize_and_rename_df(
-                    spools_df_raw, SPOOL_COLUMN_MAP, REQUIRED_SPOOL_DB_COLS, os.path.basename(spool_file_path)
-                )
-                spools_df['spool_id'] = spools_df['spool_id'].str.strip().str.upper()
 
-                # پردازش فایل SpoolItems.csv
-                spool_items_df_raw = pd.read_csv(spool_items_file_path, dtype=str).fillna('')
-                spool_items_df = self._normalize_and_rename_df(
-                    spool_items_df_raw, SPOOL_ITEM_COLUMN_MAP, REQUIRED_SPOOL_ITEM_DB_COLS, os.path.basename(spool_items_file_path)
-                )
-                spool_items_df['spool_id_str'] = spool_items_df['spool_id_str'].str.strip().str.upper()
+        # پردازش فایل Spools.csv
+        spools_df_raw = pd.read_csv(spool_file_path, dtype=str).fillna('')
+        spools_df = self._normalize_and_rename_df(
+            spools_df_raw, SPOOL_COLUMN_MAP, REQUIRED_SPOOL_DB_COLS, os.path.basename(spool_file_path)
+        )
+        spools_df['spool_id'] = spools_df['spool_id'].str.strip().str.upper()
 
-                # حذف داده‌های قدیمی (بدون تغییر)
-                session.query(SpoolConsumption).delete(synchronize_session=False)
-                session.query(SpoolItem).delete(synchronize_session=False)
-                session.query(Spool).delete(synchronize_session=False)
-                session.flush()
+        # پردازش فایل SpoolItems.csv
+        spool_items_df_raw = pd.read_csv(spool_items_file_path, dtype=str).fillna('')
+        spool_items_df = self._normalize_and_rename_df(
+            spool_items_df_raw, SPOOL_ITEM_COLUMN_MAP, REQUIRED_SPOOL_ITEM_DB_COLS, os.path.basename(spool_items_file_path)
+        )
+        spool_items_df['spool_id_str'] = spool_items_df['spool_id_str'].str.strip().str.upper()
 
-                # درج داده‌های جدید Spools و ساخت نگاشت (بدون تغییر)
-                spool_records = spools_df.to_dict(orient="records")
-                if spool_records:
-                    session.bulk_insert_mappings(Spool, spool_records)
-                session.flush()
+        # حذف داده‌های قدیمی (بدون تغییر)
+        session.query(SpoolConsumption).delete(synchronize_session=False)
+        session.query(SpoolItem).delete(synchronize_session=False)
+        session.query(Spool).delete(synchronize_session=False)
+        session.flush()
 
-                spool_id_map = {spool.spool_id: spool.id for spool in session.query(Spool.id, Spool.spool_id).all()}
+        # درج داده‌های جدید Spools و ساخت نگاشت (بدون تغییر)
+        self._append_dataframe(session, spools_df, Spool.__table__)
 
-                # درج داده‌های جدید SpoolItems (بدون تغییر)
-                spool_items_df["spool_id_fk"] = spool_items_df["spool_id_str"].map(spool_id_map)
-                spool_items_df.dropna(subset=["spool_id_fk"], inplace=True)
-                spool_items_df["spool_id_fk"] = spool_items_df["spool_id_fk"].astype(int)
+        spool_id_map = {spool.spool_id: spool.id for spool in session.query(Spool.id, Spool.spool_id).all()}
 
-                # تبدیل ستون‌های عددی
-                for col in ["class_angle", "p1_bore", "p2_bore", "thickness", "length", "qty_available"]:
-                     if col in spool_items_df.columns:
-                        spool_items_df[col] = pd.to_numeric(spool_items_df[col], errors='coerce')
+        # درج داده‌های جدید SpoolItems (بدون تغییر)
+        spool_items_df["spool_id_fk"] = spool_items_df["spool_id_str"].map(spool_id_map)
+        spool_items_df.dropna(subset=["spool_id_fk"], inplace=True)
+        spool_items_df["spool_id_fk"] = spool_items_df["spool_id_fk"].astype(int)
 
-                item_records = spool_items_df.drop(columns=["spool_id_str"]).to_dict(orient="records")
-                if item_records:
-                    session.bulk_insert_mappings(SpoolItem, item_records)
+        # تبدیل ستون‌های عددی (یک‌جا و برداری)
+        numeric_cols = spool_items_df.columns.intersection(
+            ["class_angle", "p1_bore", "p2_bore", "thickness", "length", "qty_available"])
+        spool_items_df[numeric_cols] = spool_items_df[numeric_cols].apply(pd.to_numeric, errors='coerce')
 
-            self.log_activity("system", "SPOOL_UPDATE_SUCCESS", f"{len(spools_df)} اسپول و {len(spool_items_df)} آیتم اسپول جایگزین شدند.")
-            return True, "✔ داده‌های Spool با موفقیت به صورت کامل جایگزین شدند."
+        self._append_dataframe(session, spool_items_df.drop(columns=["spool_id_str"]), SpoolItem.__table__)
 
-        except (ValueError, KeyError, FileNotFoundError) as e:
-            return False, f"خطا در فایل‌های Spool: {e}"
-        except Exception as e:
-            return False, f"خطای دیتابیس در جایگزینی Spool: {e}. (ممکن است رکوردهای مصرفی مانع حذف شده باشند)"
-        finally:
-            session.close()
+        self.log_activity("system", "SPOOL_UPDATE_SUCCESS",
+                          f"{len(spools_df)} اسپول و {len(spool_items_df)} آیتم اسپول جایگزین شدند.", session)
+        return len(spools_df), len(spool_items_df)
 
     def _validate_and_normalize_df(self, df: pd.DataFrame, required_columns: set, file_name: str) -> pd.DataFrame:
         """
@@ -2209,6 +2521,12 @@ class DataManager:
         m = re.search(r'(\d{6})', norm)
         return norm[:m.end(1)] if m else norm
 
+    _ISO_FTS_SQL = (
+        "SELECT i.file_path, i.normalized_name FROM iso_name_fts f "
+        "JOIN iso_file_index i ON i.id = f.rowid "
+        "WHERE f.normalized_name LIKE :term LIMIT :limit"
+    )
+
     def find_iso_files(self, line_text: str, limit: int = 200) -> list[str]:
         """
         (نسخه هوشمند با مقایسه شباهت)
@@ -2226,12 +2544,17 @@ class DataManager:
             # ما به جای prefix، از خود norm_input برای جستجوی انعطاف‌پذیرتر استفاده می‌کنیم.
             # این کار نتایج مرتبط بیشتری را در مرحله اول برمی‌گرداند.
             search_term = f"%{norm_input}%"
-            candidate_records = session.query(
-                IsoFileIndex.file_path,
-                IsoFileIndex.normalized_name
-            ).filter(
-                IsoFileIndex.normalized_name.like(search_term)
-            ).limit(limit * 2).all()  # کمی بیشتر از حد مجاز می‌خوانیم تا فضای کافی برای مرتب‌سازی داشته باشیم
+            if self._iso_fts_enabled and len(norm_input) >= 3:
+                # ایندکس trigram فقط برای عبارات ۳ کاراکتری و بیشتر قابل استفاده است
+                candidate_records = session.execute(text(self._ISO_FTS_SQL), {
+                    "term": search_term, "limit": limit * 2}).all()
+            else:
+                candidate_records = session.query(
+                    IsoFileIndex.file_path,
+                    IsoFileIndex.normalized_name
+                ).filter(
+                    IsoFileIndex.normalized_name.like(search_term)
+                ).limit(limit * 2).all()  # کمی بیشتر از حد مجاز می‌خوانیم تا فضای کافی برای مرتب‌سازی داشته باشیم
 
             if not candidate_records:
                 return []
@@ -2307,6 +2630,56 @@ class DataManager:
         finally:
             session.close()
 
+    ISO_FILE_EXTENSIONS = (".pdf", ".dwg")
+    PROGRESS_EMIT_INTERVAL = 0.1  # ثانیه
+
+    def _scan_iso_files(self, base_dir: str) -> Dict[str, datetime]:
+        """
+        فایل‌های PDF/DWG زیر base_dir را با os.scandir پیدا کرده و {مسیر: زمان آخرین ویرایش} برمی‌گرداند.
+        - کل درخت فقط یک بار پیموده می‌شود (به جای یک glob جداگانه برای هر پسوند).
+        - زیرپوشه‌های سطح اول به صورت موازی پیموده می‌شوند؛ روی درایوهای شبکه‌ای این کار زمان انتظار I/O را هم‌پوشانی می‌کند.
+        """
+        def walk(root):
+            found = {}
+            stack = [root]
+            while stack:
+                current = stack.pop()
+                try:
+                    with os.scandir(current) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    stack.append(entry.path)
+                                elif entry.name.lower().endswith(self.ISO_FILE_EXTENSIONS):
+                                    found[entry.path] = datetime.fromtimestamp(entry.stat().st_mtime)
+                            except OSError:
+                                continue  # فایل‌هایی که در لحظه اسکن حذف می‌شوند را نادیده بگیر
+                except OSError:
+                    continue
+            return found
+
+        files = {}
+        sub_dirs = []
+        try:
+            with os.scandir(base_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            sub_dirs.append(entry.path)
+                        elif entry.name.lower().endswith(self.ISO_FILE_EXTENSIONS):
+                            files[entry.path] = datetime.fromtimestamp(entry.stat().st_mtime)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.error(f"خطا در خواندن پوشه ISO '{base_dir}': {e}")
+            return files
+
+        if sub_dirs:
+            with ThreadPoolExecutor(max_workers=min(len(sub_dirs), os.cpu_count() or 4)) as pool:
+                for found in pool.map(walk, sub_dirs):
+                    files.update(found)
+        return files
+
     def rebuild_iso_index_from_scratch(self, base_dir: str, event_handler=None):
         """
         (نسخه نهایی و هوشمند)
@@ -2331,29 +2704,24 @@ class DataManager:
             emit_status("شروع اسکن فایل‌ها...", "info")
             emit_progress(0)
 
-            # گام ۱: تمام فایل‌های PDF و DWG را از روی دیسک پیدا کن
-            disk_files_paths = glob.glob(os.path.join(base_dir, "**", "*.pdf"), recursive=True)
-            disk_files_paths.extend(glob.glob(os.path.join(base_dir, "**", "*.dwg"), recursive=True))
+            # گام ۱: تمام فایل‌های PDF و DWG را در یک پیمایش با os.scandir پیدا کن (همراه با زمان ویرایش)
+            disk_files_map = self._scan_iso_files(base_dir)
 
-            if not disk_files_paths:
+            if not disk_files_map:
                 emit_status("هیچ فایلی یافت نشد. ایندکس پاک شد.", "warning")
                 with session.begin():
                     session.query(IsoFileIndex).delete()
                 emit_progress(100)
                 return
 
-            # ساخت یک دیکشنری از فایل‌های روی دیسک برای جستجوی سریع
-            disk_files_map = {}
-            for path in disk_files_paths:
-                try:
-                    disk_files_map[path] = datetime.fromtimestamp(os.path.getmtime(path))
-                except (FileNotFoundError, OSError):
-                    continue  # فایل‌هایی که در لحظه اسکن حذف می‌شوند را نادیده بگیر
-
             emit_status("مقایسه با ایندکس موجود...", "info")
 
             # گام ۲: تمام ایندکس موجود در دیتابیس را بخوان
-            db_files_map = {record.file_path: record.last_modified for record in session.query(IsoFileIndex).all()}
+            db_rows = session.query(IsoFileIndex.id, IsoFileIndex.file_path, IsoFileIndex.last_modified).all()
+            db_files_map = {row.file_path: row.last_modified for row in db_rows}
+            db_ids = {row.file_path: row.id for row in db_rows}
+            # خواندن بالا خودکار یک تراکنش روی سشن باز کرده؛ پیش از session.begin() گام ۴ باید بسته شود
+            session.commit()
 
             # گام ۳: تغییرات را محاسبه کن
             db_paths = set(db_files_map.keys())
@@ -2369,6 +2737,7 @@ class DataManager:
             total_ops = len(paths_to_add) + len(paths_to_delete) + len(paths_to_check)
             completed_ops = 0
             last_progress = -1
+            last_emit = 0.0
 
             # آماده‌سازی رکوردهای جدید
             for path in paths_to_add:
@@ -2384,15 +2753,19 @@ class DataManager:
             for path in paths_to_check:
                 if disk_files_map[path] != db_files_map[path]:
                     records_to_update.append({
-                        "file_path": path,
+                        "id": db_ids[path],
                         "last_modified": disk_files_map[path]
                     })
                 completed_ops += 1
                 # --- گزارش پیشرفت در حین عملیات ---
+                # حداکثر ده بار در ثانیه، تا هر سیگنال یک بازترسیم جداگانه در ترد رابط کاربری ایجاد نکند
                 progress = int((completed_ops / total_ops) * 100)
                 if progress > last_progress:
-                    emit_progress(progress)
-                    last_progress = progress
+                    now = time.monotonic()
+                    if now - last_emit >= self.PROGRESS_EMIT_INTERVAL:
+                        emit_progress(progress)
+                        last_progress = progress
+                        last_emit = now
 
             # گام ۴: اعمال تغییرات در دیتابیس
             emit_status("اعمال تغییرات در دیتابیس...", "info")
@@ -2404,12 +2777,11 @@ class DataManager:
 
                 # افزودن گروهی
                 if records_to_add:
-                    session.bulk_insert_mappings(IsoFileIndex, records_to_add)
+                    session.execute(insert(IsoFileIndex.__table__), records_to_add)
 
-                # آپدیت (این بخش باید یکی یکی انجام شود ولی همچنان سریع است)
-                for record_data in records_to_update:
-                    session.query(IsoFileIndex).filter(IsoFileIndex.file_path == record_data['file_path']).update(
-                        {"last_modified": record_data['last_modified']})
+                # آپدیت گروهی فقط برای فایل‌هایی که زمان ویرایششان تغییر کرده (بر اساس کلید اصلی)
+                if records_to_update:
+                    session.bulk_update_mappings(IsoFileIndex, records_to_update)
 
             emit_status(
                 f"ایندکس با موفقیت همگام‌سازی شد. ({len(records_to_add)} جدید, {len(paths_to_delete)} حذف, {len(records_to_update)} آپدیت)",
@@ -2449,6 +2821,81 @@ class DataManager:
         finally:
             session.close()
 
+    def bulk_upsert_iso_index_entries(self, file_paths) -> int:
+        """
+        چند فایل را با یک دستور INSERT ... ON CONFLICT و در یک تراکنش در ایندکس درج یا به‌روزرسانی می‌کند.
+        فایل‌هایی که دیگر روی دیسک نیستند از ایندکس حذف می‌شوند.
+        """
+        rows = []
+        missing_paths = []
+        for path in file_paths:
+            try:
+                last_modified = datetime.fromtimestamp(os.path.getmtime(path))
+            except (FileNotFoundError, OSError):
+                missing_paths.append(path)
+                continue
+            filename = os.path.basename(path)
+            rows.append({
+                "file_path": path,
+                "normalized_name": self._normalize_line_key(filename),
+                "prefix_key": self._extract_prefix_key(filename),
+                "last_modified": last_modified
+            })
+
+        if not rows and not missing_paths:
+            return 0
+
+        session = self.get_session()
+        try:
+            with session.begin():
+                if rows:
+                    # فایل‌هایی که زمان ویرایششان با ایندکس یکی است تغییری نکرده‌اند (مثلاً رویدادهای تکراری
+                    # modified هنگام ذخیره یا تغییر فقط در ویژگی‌های فایل)، پس دوباره نوشته نمی‌شوند
+                    stored_mtimes = {}
+                    paths = [row["file_path"] for row in rows]
+                    for start in range(0, len(paths), 500):
+                        stored_mtimes.update(session.query(IsoFileIndex.file_path, IsoFileIndex.last_modified).filter(
+                            IsoFileIndex.file_path.in_(paths[start:start + 500])).all())
+                    rows = [row for row in rows if stored_mtimes.get(row["file_path"]) != row["last_modified"]]
+                if rows:
+                    stmt = sqlite_insert(IsoFileIndex)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[IsoFileIndex.file_path],
+                        set_={
+                            "normalized_name": stmt.excluded.normalized_name,
+                            "prefix_key": stmt.excluded.prefix_key,
+                            "last_modified": stmt.excluded.last_modified
+                        }
+                    )
+                    session.execute(stmt, rows)
+                if missing_paths:
+                    session.query(IsoFileIndex).filter(IsoFileIndex.file_path.in_(missing_paths)).delete(
+                        synchronize_session=False)
+            return len(rows)
+        except Exception as e:
+            logging.error(f"خطا در bulk_upsert_iso_index_entries: {e}")
+            return 0
+        finally:
+            session.close()
+
+    def bulk_remove_iso_index_entries(self, file_paths) -> int:
+        """چند فایل را در یک تراکنش از جدول ایندکس حذف می‌کند."""
+        file_paths = list(file_paths)
+        if not file_paths:
+            return 0
+
+        session = self.get_session()
+        try:
+            with session.begin():
+                deleted = session.query(IsoFileIndex).filter(IsoFileIndex.file_path.in_(file_paths)).delete(
+                    synchronize_session=False)
+            return deleted
+        except Exception as e:
+            logging.error(f"خطا در bulk_remove_iso_index_entries: {e}")
+            return 0
+        finally:
+            session.close()
+
     #--------------------------------------------------------------------
     #  --- متدهای برای واکشی داده‌های آموزشی ---
     #--------------------------------------------------------------------
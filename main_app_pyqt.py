@@ -4,22 +4,24 @@ import sys
 import webbrowser
 import subprocess
 import os
+import re
+import math
+from bisect import bisect_left
 from functools import partial
+from operator import attrgetter
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QFormLayout,
     QLabel, QComboBox, QPushButton, QTextEdit, QFrame, QMessageBox, QLineEdit,
-
-"""Enhanced functionality with better error messages."""
     QTableWidget, QTableWidgetItem, QHeaderView, QDialog, QDialogButtonBox, QDoubleSpinBox, QSplitter,
-    QCompleter, QInputDialog, QFileDialog, QGroupBox, QProgressBar, QSplashScreen
+    QCompleter, QInputDialog, QFileDialog, QGroupBox, QProgressBar, QSplashScreen, QStyledItemDelegate,
+    QTableView, QProgressDialog
 )
 
-from PyQt6.QtGui import QFont, QColor, QPixmap, QMovie
-from PyQt6.QtCore import Qt, QStringListModel, pyqtSignal, QObject, QTimer
-
-# برای نمایش نمودار در PyQt6
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
+from PyQt6.QtGui import QFont, QColor, QPixmap, QMovie, QDesktopServices, QTextCharFormat, QTextCursor
+from PyQt6.QtCore import (
+    Qt, QStringListModel, pyqtSignal, QObject, QTimer, QThread, QRunnable, QThreadPool,
+    QAbstractTableModel, QModelIndex, QUrl
+)
 
 # فرض بر این است که این دو فایل در کنار این اسکریپت قرار دارند
 from data_manager import DataManager
@@ -27,12 +29,40 @@ from models import Project, MTOItem, MIVRecord, Spool, SpoolItem  # برای typ
 
 import sys, traceback
 
+import queue
 import threading
 import time
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 from config_manager import DB_PATH, DASHBOARD_PASSWORD, ISO_PATH
 
+# عدد اعشاری ساده (مثل 12، ‎-3.5، ‎.75) برای خواندن سلول‌های عددی جدول بدون try/except
+_NUM_RE = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)")
+
+
+def _safe_float(text):
+    """متن سلول را به عدد با دو رقم اعشار تبدیل می‌کند؛ برای متن خالی یا نامعتبر None برمی‌گرداند."""
+    if not text:
+        return None
+    text = text.strip()
+    if not text or not _NUM_RE.fullmatch(text):
+        return None
+    return round(float(text), 2)
+
+
+def _to_hundredths(value):
+    """مقدار دو رقم اعشاری را به عدد صحیح (واحد یک‌صدم) تبدیل می‌کند تا جمع‌ها دقیق و بدون خطای float باشند."""
+    return int(round((value or 0) * 100))
+
+
+# نمونه اولیه سلول فقط-خواندنی؛ سلول‌ها با clone() ساخته می‌شوند تا فلگ‌ها برای هر سلول جداگانه تنظیم نشوند
+_READONLY_ITEM = QTableWidgetItem()
+_READONLY_ITEM.setFlags(_READONLY_ITEM.flags() & ~Qt.ItemFlag.ItemIsEditable)
+
+
+def _readonly_item(text):
+    cell = _READONLY_ITEM.clone()
+    cell.setText(text)
+    return cell
+
 
 class SplashScreen(QSplashScreen):
 
@@ -79,46 +109,130 @@ class SplashScreen(QSplashScreen):
         self.message_label.setStyleSheet(f"color: {color.name()}; font-size: 16px; margin-bottom: 20px;")
 
 
-class IsoIndexEventHandler(QObject, FileSystemEventHandler):  # 👈 **ORDER SWAPPED HERE**
+class IsoIndexEventHandler(QObject):
     """
     This class reacts to file system changes (create, delete, modify)
     and calls the appropriate DataManager functions to update the database.
+    Events are queued and written by a worker thread in batched transactions,
+    so a slow SQLite commit never blocks the watchdog observer thread.
+    It implements watchdog's dispatch() itself, so watchdog is only imported
+    when the watcher is actually started.
     """
     status_updated = pyqtSignal(str, str)
     progress_updated = pyqtSignal(int)
 
+    BATCH_WINDOW_SECONDS = 0.25  # سکوت لازم بعد از آخرین رویداد قبل از نوشتن دسته در دیتابیس
+    MAX_LATENCY_SECONDS = 0.5  # حداکثر تاخیر از اولین رویداد دسته تا نوشتن
+    MAX_BATCH_SIZE = 256
+    HANDLED_EVENTS = frozenset({"created", "deleted", "modified", "moved"})
+    _STOP = object()
+
     def __init__(self, dm: DataManager):
-        # The super().__init__() call now correctly initializes the QObject first.
         super().__init__()
-        # We no longer need to call FileSystemEventHandler.__init__() separately.
 
         self.dm = dm
         self.SUPPORTED_EXTENSIONS = {".pdf", ".dwg"}
 
+        # رویدادهای watchdog فقط در صف قرار می‌گیرند و نوشتن در دیتابیس روی ترد جداگانه انجام می‌شود
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._drain, name="iso-index-writer", daemon=True)
+        self._worker.start()
+
+    def dispatch(self, event):
+        """
+        معادل FileSystemEventHandler.dispatch: رویداد را به متد on_<event_type> مربوطه می‌فرستد.
+        رویدادهای پوشه، باز/بسته شدن فایل (opened/closed) و فایل‌هایی با پسوند نامرتبط
+        همین‌جا و پیش از ورود به صف دور ریخته می‌شوند.
+        """
+        if event.is_directory or event.event_type not in self.HANDLED_EVENTS:
+            return
+        if not (self._is_supported(event.src_path) or self._is_supported(getattr(event, "dest_path", "") or "")):
+            return
+        getattr(self, f"on_{event.event_type}")(event)
+
     def _is_supported(self, path):
         return os.path.splitext(path)[1].lower() in self.SUPPORTED_EXTENSIONS
 
+    def _drain(self):
+        """رویدادها را دسته‌بندی کرده (آخرین رویداد هر مسیر برنده است) و هر دسته را در یک تراکنش اعمال می‌کند."""
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+
+            path, op = item
+            pending = {path: op}
+            stop = False
+            deadline = time.monotonic() + self.MAX_LATENCY_SECONDS
+            while len(pending) < self.MAX_BATCH_SIZE:
+                timeout = min(self.BATCH_WINDOW_SECONDS, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                path, op = item
+                pending[path] = op
+
+            self._write_batch(pending)
+            if stop:
+                return
+
+    def _write_batch(self, pending):
+        upserts = [path for path, op in pending.items() if op == "upsert"]
+        removes = [path for path, op in pending.items() if op == "remove"]
+        try:
+            if removes:
+                self.dm.bulk_remove_iso_index_entries(removes)
+            if upserts:
+                self.dm.bulk_upsert_iso_index_entries(upserts)
+        except Exception as e:
+            self.status_updated.emit(f"خطا در ثبت تغییرات ایندکس: {e}", "error")
+            return
+        if len(pending) > 1:
+            self.status_updated.emit(
+                f"{len(upserts)} فایل به‌روزرسانی و {len(removes)} فایل حذف شد (یک تراکنش).", "info")
+
+    def _schedule(self, path, op):
+        self._queue.put((path, op))
+
+    def stop(self, timeout=5.0):
+        """ترد نویسنده را پس از ثبت رویدادهای باقی‌مانده متوقف می‌کند."""
+        self._queue.put(self._STOP)
+        self._worker.join(timeout)
+
     def on_created(self, event):
         if not event.is_directory and self._is_supported(event.src_path):
             self.status_updated.emit(f"فایل جدید شناسایی شد: {os.path.basename(event.src_path)}", "info")
-            self.dm.upsert_iso_index_entry(event.src_path)
+            self._schedule(event.src_path, "upsert")
 
     def on_deleted(self, event):
         if not event.is_directory and self._is_supported(event.src_path):
             self.status_updated.emit(f"فایل حذف شد: {os.path.basename(event.src_path)}", "warning")
-            self.dm.remove_iso_index_entry(event.src_path)
+            self._schedule(event.src_path, "remove")
 
     def on_modified(self, event):
         if not event.is_directory and self._is_supported(event.src_path):
             self.status_updated.emit(f"فایل ویرایش شد: {os.path.basename(event.src_path)}", "info")
-            self.dm.upsert_iso_index_entry(event.src_path)
+            self._schedule(event.src_path, "upsert")
 
     def on_moved(self, event):
-        if not event.is_directory and self._is_supported(event.src_path):
-            self.status_updated.emit(f"فایل منتقل شد: {os.path.basename(event.src_path)} -> {os.path.basename(event.dest_path)}", "info")
-            self.dm.remove_iso_index_entry(event.src_path)
-            if self._is_supported(event.dest_path):
-                self.dm.upsert_iso_index_entry(event.dest_path)
+        if event.is_directory:
+            return
+        src_supported = self._is_supported(event.src_path)
+        dest_supported = self._is_supported(event.dest_path)
+        if not (src_supported or dest_supported):
+            return
+        self.status_updated.emit(f"فایل منتقل شد: {os.path.basename(event.src_path)} -> {os.path.basename(event.dest_path)}", "info")
+        if src_supported:
+            self._schedule(event.src_path, "remove")
+        # ذخیره فایل با نام موقت و سپس تغییر نام به .pdf/.dwg هم باید ایندکس شود
+        if dest_supported:
+            self._schedule(event.dest_path, "upsert")
 
 
 class SpoolManagerDialog(QDialog):
@@ -188,36 +302,58 @@ class SpoolManagerDialog(QDialog):
         self.close_btn.clicked.connect(self.close)
 
     def setup_spool_id_completer(self):
-        """لیست شناسه‌های اسپول را از دیتابیس گرفته و به ورودی اضافه می‌کند."""
+        """لیست شناسه‌های اسپول را یک بار از دیتابیس گرفته و به ورودی اضافه می‌کند."""
+        self._completer_model = QStringListModel(self)
+        self._spool_ids_set = set()
+        completer = QCompleter(self._completer_model, self)
+        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.spool_id_entry.setCompleter(completer)
         try:
             spool_ids = self.dm.get_all_spool_ids()
-            model = QStringListModel()
-            model.setStringList(spool_ids)
-            completer = QCompleter(model, self)
-            completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-            self.spool_id_entry.setCompleter(completer)
+            self._spool_ids_set.update(spool_ids)
+            self._completer_model.setStringList(spool_ids)
         except Exception as e:
             self.log_to_console(f"Failed to setup completer: {e}", "error")
 
+    def add_spool_id_to_completer(self, spool_id):
+        """شناسه اسپول تازه ساخته‌شده را بدون خواندن دوباره کل لیست به completer اضافه می‌کند."""
+        if spool_id in self._spool_ids_set:
+            return
+        self._spool_ids_set.add(spool_id)
+        row = self._completer_model.rowCount()
+        self._completer_model.insertRow(row)
+        self._completer_model.setData(self._completer_model.index(row), spool_id)
+
     def populate_table(self, items: list[SpoolItem]):
         """جدول را با آیتم‌های یک اسپول پر می‌کند."""
-        self.table.setRowCount(0)  # <<< ADDED: پاک کردن جدول قبل از پر کردن
-        self.table.setRowCount(len(items))
-        for row, item in enumerate(items):
-            def to_str(val):
-                return str(val) if val is not None else ""
-
-            self.table.setItem(row, 0, QTableWidgetItem(item.component_type or ""))
-            self.table.setItem(row, 1, QTableWidgetItem(item.class_angle or ""))
-            self.table.setItem(row, 2, QTableWidgetItem(to_str(item.p1_bore)))
-            self.table.setItem(row, 3, QTableWidgetItem(to_str(item.p2_bore)))
-            self.table.setItem(row, 4, QTableWidgetItem(item.material or ""))
-            self.table.setItem(row, 5, QTableWidgetItem(item.schedule or ""))
-            # --- CHANGE: نمایش مقدار Thickness در ستون جدید ---
-            self.table.setItem(row, 6, QTableWidgetItem(to_str(item.thickness)))
-            self.table.setItem(row, 7, QTableWidgetItem(to_str(item.length)))
-            self.table.setItem(row, 8, QTableWidgetItem(to_str(item.qty_available)))
-            self.table.setItem(row, 9, QTableWidgetItem(item.item_code or ""))
+        def to_str(val):
+            return str(val) if val is not None else ""
+
+        # در حین پر کردن، رسم مجدد، سیگنال‌ها و محاسبه عرض ستون‌ها متوقف می‌شود تا فقط یک بار layout انجام شود
+        header = self.table.horizontalHeader()
+        resize_mode = header.sectionResizeMode(0)
+        self.table.setUpdatesEnabled(False)
+        self.table.blockSignals(True)
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        try:
+            self.table.setRowCount(0)  # <<< ADDED: پاک کردن جدول قبل از پر کردن
+            self.table.setRowCount(len(items))
+            for row, item in enumerate(items):
+                self.table.setItem(row, 0, QTableWidgetItem(item.component_type or ""))
+                self.table.setItem(row, 1, QTableWidgetItem(item.class_angle or ""))
+                self.table.setItem(row, 2, QTableWidgetItem(to_str(item.p1_bore)))
+                self.table.setItem(row, 3, QTableWidgetItem(to_str(item.p2_bore)))
+                self.table.setItem(row, 4, QTableWidgetItem(item.material or ""))
+                self.table.setItem(row, 5, QTableWidgetItem(item.schedule or ""))
+                # --- CHANGE: نمایش مقدار Thickness در ستون جدید ---
+                self.table.setItem(row, 6, QTableWidgetItem(to_str(item.thickness)))
+                self.table.setItem(row, 7, QTableWidgetItem(to_str(item.length)))
+                self.table.setItem(row, 8, QTableWidgetItem(to_str(item.qty_available)))
+                self.table.setItem(row, 9, QTableWidgetItem(item.item_code or ""))
+        finally:
+            header.setSectionResizeMode(resize_mode)
+            self.table.blockSignals(False)
+            self.table.setUpdatesEnabled(True)
 
     def add_row(self):
         self.table.insertRow(self.table.rowCount())
@@ -266,36 +402,29 @@ class SpoolManagerDialog(QDialog):
             return
 
         try:
-            def safe_float(txt):
-                if txt is None: return None
-                s = str(txt).strip()
-                if not s: return None
-                try:
-                    return round(float(s), 2)
-                except (ValueError, TypeError):
-                    return None
+            get = self.table.item
+
+            def get_item_text(row, col, to_upper=False):
+                item = get(row, col)
+                text = item.text().strip() if item and item.text() else None
+                # --- CHANGE: تبدیل فیلدهای متنی به حروف بزرگ ---
+                if text and to_upper:
+                    return text.upper()
+                return text
 
             items_data = []
             for r in range(self.table.rowCount()):
-                def get_item_text(row, col, to_upper=False):
-                    item = self.table.item(row, col)
-                    text = item.text().strip() if item and item.text() else None
-                    # --- CHANGE: تبدیل فیلدهای متنی به حروف بزرگ ---
-                    if text and to_upper:
-                        return text.upper()
-                    return text
-
                 row_data = {
                     "component_type": get_item_text(r, 0, to_upper=True),
                     "class_angle": get_item_text(r, 1, to_upper=True),
-                    "p1_bore": safe_float(get_item_text(r, 2)),
-                    "p2_bore": safe_float(get_item_text(r, 3)),
+                    "p1_bore": _safe_float(get_item_text(r, 2)),
+                    "p2_bore": _safe_float(get_item_text(r, 3)),
                     "material": get_item_text(r, 4, to_upper=True),
                     "schedule": get_item_text(r, 5, to_upper=True),
                     # --- CHANGE: خواندن مقدار Thickness از ستون جدید ---
-                    "thickness": safe_float(get_item_text(r, 6)),
-                    "length": safe_float(get_item_text(r, 7)),
-                    "qty_available": safe_float(get_item_text(r, 8)),
+                    "thickness": _safe_float(get_item_text(r, 6)),
+                    "length": _safe_float(get_item_text(r, 7)),
+                    "qty_available": _safe_float(get_item_text(r, 8)),
                     "item_code": get_item_text(r, 9, to_upper=True)
                 }
                 if row_data["component_type"]:
@@ -326,7 +455,7 @@ class SpoolManagerDialog(QDialog):
 # FIXME: Optimize this section for better performance
             if success:
                 self.show_msg("موفق", msg)
-                self.setup_spool_id_completer()
+                self.add_spool_id_to_completer(spool_id)
             else:
                 self.show_msg("خطا", msg, icon=QMessageBox.Icon.Critical)
 
@@ -365,6 +494,106 @@ class SpoolManagerDialog(QDialog):
             print(f"[{level.upper()}] {message}")
 
 
+class SuggestionSignals(QObject):
+    done = pyqtSignal(int, list)
+
+
+class SuggestionWorker(QRunnable):
+    """
+    کوئری پیشنهاد شماره خط را روی QThreadPool اجرا می‌کند و نتیجه را همراه شماره ترتیبی درخواست برمی‌گرداند.
+    هر فراخوانی DataManager نشست (session) مستقل خود را می‌سازد، پس اجرای هم‌زمان اتصال مشترک ندارد.
+    """
+
+    def __init__(self, dm: DataManager, prefix: str, seq: int, limit: int):
+        super().__init__()
+        self.dm = dm
+        self.prefix = prefix
+        self.seq = seq
+        self.limit = limit
+        self.signals = SuggestionSignals()
+
+    def run(self):
+        # خطاهای کوئری داخل DataManager لاگ شده و به صورت لیست خالی برمی‌گردند
+        self.signals.done.emit(self.seq, self.dm.get_line_no_suggestions(self.prefix, limit=self.limit))
+
+
+class LineIndexSignals(QObject):
+    done = pyqtSignal(list)
+    failed = pyqtSignal()
+
+
+class LineIndexWorker(QRunnable):
+    """لیست مرتب تمام شماره خط‌ها را برای ایندکس پیشوندی در حافظه، روی QThreadPool می‌خواند."""
+
+    def __init__(self, dm: DataManager):
+        super().__init__()
+        self.dm = dm
+        self.signals = LineIndexSignals()
+
+    def run(self):
+        # خطای کوئری داخل DataManager لاگ شده و به صورت None برمی‌گردد
+        rows = self.dm.get_all_line_nos()
+        if rows is None:
+            self.signals.failed.emit()
+        else:
+            self.signals.done.emit(rows)
+
+
+class IsoSearchSignals(QObject):
+    done = pyqtSignal(list)
+    failed = pyqtSignal(str)
+
+
+class IsoSearchWorker(QRunnable):
+    """جستجوی فایل‌های ISO/DWG را روی QThreadPool اجرا می‌کند تا کلیک روی دکمه جستجو رابط کاربری را قفل نکند."""
+
+    def __init__(self, dm: DataManager, line_no: str):
+        super().__init__()
+        self.dm = dm
+        self.line_no = line_no
+        self.signals = IsoSearchSignals()
+
+    def run(self):
+        try:
+            matches = self.dm.find_iso_files(self.line_no)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.done.emit(matches)
+
+
+class SpinBoxDelegate(QStyledItemDelegate):
+    """
+    مقدار مصرف را به صورت متن رسم می‌کند و فقط برای سلولی که در حال ویرایش است یک QDoubleSpinBox می‌سازد.
+    سقف مجاز هر سلول از UserRole (موجودی) و ظرفیت باقی‌مانده MTO محاسبه می‌شود.
+    """
+
+    def __init__(self, headroom_getter, parent=None):
+        super().__init__(parent)
+        self._headroom_getter = headroom_getter
+
+    def createEditor(self, parent, option, index):
+        editor = QDoubleSpinBox(parent)
+        editor.setDecimals(2)
+        max_avail = index.data(Qt.ItemDataRole.UserRole) or 0
+        current = index.data(Qt.ItemDataRole.EditRole) or 0
+        editor.setRange(0, max(0, min(max_avail, current + self._headroom_getter())))
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setValue(float(index.data(Qt.ItemDataRole.EditRole) or 0))
+
+    def setModelData(self, editor, model, index):
+        editor.interpretText()
+        model.setData(index, round(editor.value(), 2), Qt.ItemDataRole.EditRole)
+
+    def displayText(self, value, locale):
+        try:
+            return f"{float(value):.2f}"
+        except (TypeError, ValueError):
+            return super().displayText(value, locale)
+
+
 class SpoolSelectionDialog(QDialog):
     def __init__(self, matching_items: list[SpoolItem], remaining_mto_qty: float, parent=None):
         super().__init__(parent)
@@ -415,6 +644,8 @@ class SpoolSelectionDialog(QDialog):
             "Material", "Schedule", "Thickness", "Length", "Qty Avail.", "موجودی", "مقدار مصرف"
         ])
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.table.setItemDelegateForColumn(13, SpinBoxDelegate(self.remaining_headroom, self.table))
+        self.table.itemChanged.connect(self.on_item_changed)
         layout.addWidget(self.table)
 
         self.populate_table()
@@ -425,70 +656,94 @@ class SpoolSelectionDialog(QDialog):
         layout.addWidget(self.buttons)
 
     def populate_table(self):
-        self.spin_boxes_info = []
-        self.table.setRowCount(0)  # <<< ADDED: پاک کردن جدول قبل از پر کردن
-        self.table.setRowCount(len(self.items))
-
-        for row, item in enumerate(self.items):
-            self.table.setItem(row, 0, QTableWidgetItem(str(item.id)))
-            self.table.setItem(row, 1, QTableWidgetItem(str(item.spool.spool_id)))
-            # ... (ستون‌های 2 تا 9 بدون تغییر)
-            self.table.setItem(row, 2, QTableWidgetItem(item.item_code or ""))
-            self.table.setItem(row, 3, QTableWidgetItem(item.component_type or ""))
-            self.table.setItem(row, 4, QTableWidgetItem(str(item.class_angle) if item.class_angle is not None else ""))
-            self.table.setItem(row, 5, QTableWidgetItem(str(item.p1_bore or "")))
-            self.table.setItem(row, 6, QTableWidgetItem(str(item.p2_bore or "")))
-            self.table.setItem(row, 7, QTableWidgetItem(item.material or ""))
-            self.table.setItem(row, 8, QTableWidgetItem(item.schedule or ""))
-            self.table.setItem(row, 9, QTableWidgetItem(str(item.thickness or "")))
-
-            self.table.setItem(row, 10, QTableWidgetItem(str(item.length or "")))
-            self.table.setItem(row, 11, QTableWidgetItem(str(item.qty_available or "")))
-
-            # --- CHANGE: حذف تبدیل واحد ---
-            is_pipe = "PIPE" in (item.component_type or "").upper()
-            if is_pipe:
-                available_qty_for_ui = item.length or 0  # دیگر تقسیم بر ۱۰۰۰ نداریم
-            else:
-                available_qty_for_ui = item.qty_available or 0
-
-            # نمایش موجودی با دو رقم اعشار
-            self.table.setItem(row, 12, QTableWidgetItem(f"{available_qty_for_ui:.2f}"))
-
-            spin_box = QDoubleSpinBox()
-            spin_box.setRange(0, available_qty_for_ui)
-            # --- CHANGE: تنظیم دقت به ۲ رقم اعشار ---
-            spin_box.setDecimals(2)
-            spin_box.valueChanged.connect(self.update_totals)
-            self.table.setCellWidget(row, 13, spin_box)
-
-            self.spin_boxes_info.append({'widget': spin_box, 'max_avail': available_qty_for_ui})
-
-            for col in range(13):
-                cell_item = self.table.item(row, col)
-                if cell_item:
-                    cell_item.setFlags(cell_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
+        self._values = []  # مقدار مصرف هر ردیف به یک‌صدم (int)؛ منبع اصلی داده برای جمع و خروجی
+        items = self.items
+        self._visible_rows = list(range(len(items)))  # ردیف‌هایی که از فیلتر عبور کرده‌اند
+        # داده‌ها یک بار به صورت ستونی (یک لیست برای هر ستون) استخراج می‌شوند تا حلقه ردیف‌ها به ویژگی‌های ORM دست نزند
+        ids = [str(it.id) for it in items]
+        spool_ids = [str(it.spool.spool_id) for it in items]
+        item_codes = [it.item_code or "" for it in items]
+        comp_types = [it.component_type or "" for it in items]
+        class_angles = [str(it.class_angle) if it.class_angle is not None else "" for it in items]
+        bores1 = [str(it.p1_bore or "") for it in items]
+        bores2 = [str(it.p2_bore or "") for it in items]
+        materials = [it.material or "" for it in items]
+        schedules = [it.schedule or "" for it in items]
+        thicknesses = [str(it.thickness or "") for it in items]
+        lengths = [str(it.length or "") for it in items]
+        self._qty_available = [it.qty_available or 0 for it in items]
+        qtys = [str(it.qty_available or "") for it in items]
+        comp_types_upper = [c.upper() for c in comp_types]
+        # --- CHANGE: حذف تبدیل واحد --- (برای لوله طول، برای بقیه تعداد)
+        available = [(it.length or 0) if "PIPE" in ct else (it.qty_available or 0)
+                     for it, ct in zip(items, comp_types_upper)]
+        # نمایش موجودی با دو رقم اعشار؛ یک بار برای کل ستون قالب‌بندی می‌شود
+        available_strs = [f"{v:.2f}" for v in available]
+        # نسخه حروف بزرگ ستون‌های قابل فیلتر برای filter_table نگه داشته می‌شود
+        self._filter_columns_upper = {
+            2: [c.upper() for c in item_codes],
+            3: comp_types_upper,
+            5: [b.upper() for b in bores1],
+            7: [m.upper() for m in materials],
+        }
+
+        # سیگنال itemChanged و رسم مجدد در حین پر کردن غیرفعال است؛ ستون‌ها در پایان یک بار اندازه می‌شوند
+        header = self.table.horizontalHeader()
+        resize_mode = header.sectionResizeMode(0)
+        self.table.setUpdatesEnabled(False)
+        self.table.blockSignals(True)
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        try:
+            self.table.setRowCount(0)  # <<< ADDED: پاک کردن جدول قبل از پر کردن
+            self.table.setRowCount(len(items))
+
+            for row in range(len(items)):
+                self.table.setItem(row, 0, _readonly_item(ids[row]))
+                self.table.setItem(row, 1, _readonly_item(spool_ids[row]))
+                self.table.setItem(row, 2, _readonly_item(item_codes[row]))
+                self.table.setItem(row, 3, _readonly_item(comp_types[row]))
+                self.table.setItem(row, 4, _readonly_item(class_angles[row]))
+                self.table.setItem(row, 5, _readonly_item(bores1[row]))
+                self.table.setItem(row, 6, _readonly_item(bores2[row]))
+                self.table.setItem(row, 7, _readonly_item(materials[row]))
+                self.table.setItem(row, 8, _readonly_item(schedules[row]))
+                self.table.setItem(row, 9, _readonly_item(thicknesses[row]))
+
+                self.table.setItem(row, 10, _readonly_item(lengths[row]))
+                self.table.setItem(row, 11, _readonly_item(qtys[row]))
+
+                self.table.setItem(row, 12, _readonly_item(available_strs[row]))
+
+                # سلول مقدار مصرف: ویرایش از طریق SpinBoxDelegate، موجودی در UserRole
+                qty_cell = QTableWidgetItem()
+                qty_cell.setData(Qt.ItemDataRole.EditRole, 0.0)
+                qty_cell.setData(Qt.ItemDataRole.UserRole, available[row])
+                self._values.append(0)
+                self.table.setItem(row, 13, qty_cell)
+        finally:
+            header.setSectionResizeMode(resize_mode)
+            self.table.blockSignals(False)
+            self.table.setUpdatesEnabled(True)
 
         self.update_totals()
 
     def accept_data(self):
         self.selected_data = []
-        for row in range(self.table.rowCount()):
-            if self.table.isRowHidden(row):
-                continue
-
-            spin_box = self.table.cellWidget(row, 13)
-            used_qty_from_ui = spin_box.value()
+        for row in self._visible_rows:
+            used_hundredths = self._values[row]
 
-            if used_qty_from_ui > 0.001:
+            if used_hundredths > 0:
                 spool_item_id = int(self.table.item(row, 0).text())
 
-                # --- CHANGE: حذف تبدیل واحد و گرد کردن نهایی ---
-                used_qty_for_db = round(used_qty_from_ui, 2)
+                # --- CHANGE: حذف تبدیل واحد؛ مقدار از قبل به دو رقم اعشار ثابت است ---
+                used_qty_for_db = used_hundredths / 100
 
+                # شناسه اسپول و موجودی پس از مصرف همراه انتخاب ارسال می‌شوند تا دیالوگ والد نیازی به دیتابیس نداشته باشد
                 self.selected_data.append({
                     "spool_item_id": spool_item_id,
-                    "used_qty": used_qty_for_db
+                    "spool_id": self.table.item(row, 1).text(),
+                    "used_qty": used_qty_for_db,
+                    "qty_after": round(self._qty_available[row] - used_qty_for_db, 2)
                 })
         self.accept()
 
@@ -498,40 +753,87 @@ class SpoolSelectionDialog(QDialog):
     def filter_table(self):
         """Hides rows that do not match the filter criteria."""
         # --- CHANGE: تبدیل به حروف بزرگ برای جستجوی غیرحساس به بزرگی و کوچکی ---
-        filter_texts = {col: f.text().upper() for col, f in self.filters.items()}
+        # فقط فیلترهای غیرخالی همراه با ستون حروف بزرگ از پیش محاسبه‌شده‌شان بررسی می‌شوند
+        active = [(f.text().upper(), self._filter_columns_upper[col])
+                  for col, f in self.filters.items() if f.text()]
 
+        self._visible_rows = []
         for row in range(self.table.rowCount()):
-            is_visible = True
-            for col, filter_text in filter_texts.items():
-                if not filter_text:
-                    continue
-                item = self.table.item(row, col)
-                # --- CHANGE: متن سلول هم به حروف بزرگ تبدیل می‌شود ---
-                if not item or filter_text not in item.text().upper():
-                    is_visible = False
-                    break
+            is_visible = all(text in values[row] for text, values in active)
+            if is_visible:
+                self._visible_rows.append(row)
             self.table.setRowHidden(row, not is_visible)
 
+    def remaining_headroom(self):
+        """ظرفیت باقی‌مانده MTO پس از کسر مقادیر انتخاب شده."""
+        return self.remaining_mto_qty - sum(self._values) / 100
+
+    def on_item_changed(self, item):
+        if item.column() != 13:
+            return
+        self._values[item.row()] = _to_hundredths(item.data(Qt.ItemDataRole.EditRole))
+        self.update_totals()
+
     def update_totals(self):
-        """Calculates the total selected quantity and dynamically updates the limits of all spin boxes."""
-        current_total = sum(info['widget'].value() for info in self.spin_boxes_info)
+        """Calculates the total selected quantity; per-row limits are applied by the delegate when editing."""
+        total_hundredths = sum(self._values)
 
         # --- CHANGE: آپدیت لیبل با دو رقم اعشار ---
-        self.total_selected_label.setText(f"جمع انتخاب شده: {current_total:.2f}")
-        if current_total > self.remaining_mto_qty:
+        self.total_selected_label.setText(f"جمع انتخاب شده: {total_hundredths / 100:.2f}")
+        if total_hundredths > _to_hundredths(self.remaining_mto_qty):
             self.total_selected_label.setStyleSheet("font-weight: bold; padding: 5px; background-color: #f8d7da;")
         else:
             self.total_selected_label.setStyleSheet("font-weight: bold; padding: 5px; background-color: #d1e7dd;")
 
-        remaining_headroom = self.remaining_mto_qty - current_total
 
-        for info in self.spin_boxes_info:
-            spin_box = info['widget']
-            new_max = min(info['max_avail'], spin_box.value() + remaining_headroom)
+class CsvUpdateWorker(QThread):
+    """به‌روزرسانی داده‌ها از فایل‌های CSV را خارج از ترد رابط کاربری اجرا کرده و پیشرفت را گزارش می‌کند."""
+    progress = pyqtSignal(int)
+    done = pyqtSignal(bool, str)
+
+    def __init__(self, dm: DataManager, file_paths: list[str], parent=None):
+        super().__init__(parent)
+        self.dm = dm
+        self.file_paths = file_paths
+
+    def run(self):
+        success, message = self.dm.process_selected_csv_files(self.file_paths, progress_callback=self.progress.emit)
+        self.done.emit(success, message)
+
 
-            spin_box.blockSignals(True)
-            spin_box.setMaximum(max(0, new_max))
-            spin_box.blockSignals(False)
+class LineProgressLoader(QObject):
+    """
+    داده‌های پیشرفت یک خط و وجود آیتم سازگار در انبار اسپول را روی یک QThread جداگانه می‌خواند
+    تا دیالوگ مصرف بدون یخ زدن رابط کاربری باز شود.
+    """
+    loaded = pyqtSignal(list, dict)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, dm: DataManager, project_id: int, line_no: str):
+        super().__init__()
+        self.dm = dm
+        self.project_id = project_id
+        self.line_no = line_no
+
+    def run(self):
+        thread = QThread.currentThread()
+        try:
+            progress_data = self.dm.get_enriched_line_progress(self.project_id, self.line_no, readonly=False)
+            # هر ترکیب (Type, Bore) فقط یک بار در انبار اسپول جستجو می‌شود
+            has_spool_match = {}
+            for item in progress_data:
+                if thread.isInterruptionRequested():
+                    return
+                key = (item.get("Type"), item.get("Bore"))
+                if key not in has_spool_match:
+                    has_spool_match[key] = bool(self.dm.get_mapped_spool_items(*key))
+            if not thread.isInterruptionRequested():
+                self.loaded.emit(progress_data, has_spool_match)
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            self.finished.emit()
 
 
 class MTOConsumptionDialog(QDialog):
@@ -576,9 +878,18 @@ class MTOConsumptionDialog(QDialog):
             "انتخاب اسپول", "Spool ID", "Qty from Spool", "Spool Remaining"
         ])
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
-        self.table.resizeColumnsToContents()
+        # اندازه ستون‌ها فقط از روی ۵۰ ردیف اول محاسبه می‌شود، نه کل جدول
+        self.table.horizontalHeader().setResizeContentsPrecision(50)
+        self._columns_sized = False
         layout.addWidget(self.table)
 
+        # تا رسیدن داده‌ها از ترد بارگذاری، یک نوار پیشرفت نامعین نمایش داده می‌شود
+        self.loading_bar = QProgressBar()
+        self.loading_bar.setRange(0, 0)
+        self.loading_bar.setFormat("در حال بارگذاری آیتم‌های خط...")
+        self.loading_bar.setTextVisible(True)
+        layout.addWidget(self.loading_bar)
+
         optimize_spool_btn = QPushButton("⚙️ محاسبه بهینه اسپول (تست)")
         optimize_spool_btn.clicked.connect(self.handle_spool_optimization)
 
@@ -588,6 +899,35 @@ class MTOConsumptionDialog(QDialog):
         extra_btns_layout.addStretch()
         layout.addLayout(extra_btns_layout)
 
+        self.buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        self.buttons.accepted.connect(self.accept_data)
+        self.buttons.rejected.connect(self.reject)
+        self.buttons.button(QDialogButtonBox.StandardButton.Ok).setEnabled(False)
+        layout.addWidget(self.buttons)
+
+        self.progress_data = []
+        self._spool_matches = {}
+        self._closing = False
+        self._start_loading()
+
+    def _start_loading(self):
+        """خواندن داده‌های خط را روی یک QThread شروع می‌کند."""
+        self._load_thread = QThread(self)
+        self._loader = LineProgressLoader(self.dm, self.project_id, self.line_no)
+        self._loader.moveToThread(self._load_thread)
+        self._load_thread.started.connect(self._loader.run)
+        self._loader.loaded.connect(self._on_loaded)
+        self._loader.failed.connect(self._on_load_failed)
+        self._loader.finished.connect(self._load_thread.quit)
+        self._load_thread.finished.connect(self._loader.deleteLater)
+        self._load_thread.start()
+
+    def _on_loaded(self, progress_data, spool_matches):
+        if self._closing:
+            return
+        self.progress_data = progress_data
+        self._spool_matches = spool_matches
+        self.loading_bar.hide()
         self.populate_table()
 
         # ️ -------------اتصال سیگنال تغییر مقدار به تابع جدید------------
@@ -596,28 +936,50 @@ class MTOConsumptionDialog(QDialog):
             if spin_box:
                 spin_box.valueChanged.connect(self.update_recommendations)
 
-        self.buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
-        self.buttons.accepted.connect(self.accept_data)
-        self.buttons.rejected.connect(self.reject)
-        layout.addWidget(self.buttons)
+        self.buttons.button(QDialogButtonBox.StandardButton.Ok).setEnabled(True)
+
+    def _on_load_failed(self, message):
+        if self._closing:
+            return
+        self.loading_bar.hide()
+        QMessageBox.critical(self, "خطا", f"خطا در بارگذاری آیتم‌های خط: {message}")
+
+    def done(self, result):
+        # اگر دیالوگ پیش از پایان بارگذاری بسته شود، ترد متوقف می‌شود و نتیجه‌اش نادیده گرفته می‌شود
+        self._closing = True
+        if self._load_thread.isRunning():
+            self._load_thread.requestInterruption()
+            self._load_thread.quit()
+            self._load_thread.wait()
+        super().done(result)
 
     def populate_table(self):
-        self.progress_data = self.dm.get_enriched_line_progress(self.project_id, self.line_no, readonly=False)
+        self.table.setUpdatesEnabled(False)
+        try:
+            self._fill_rows()
+            # فقط در اولین بار اندازه ستون‌ها تنظیم می‌شود؛ پر کردن‌های بعدی عرض دستی کاربر را حفظ می‌کنند
+            if not self._columns_sized:
+                self.table.resizeColumnsToContents()
+                self._columns_sized = True
+        finally:
+            self.table.setUpdatesEnabled(True)
+
+    def _fill_rows(self):
         self.table.setRowCount(len(self.progress_data))
 
         for row_idx, item in enumerate(self.progress_data):
             mto_item_id = item["mto_item_id"]
 
             # ستون‌های MTO (0-7)
-            self.table.setItem(row_idx, 0, QTableWidgetItem(item["Item Code"] or ""))
-            self.table.setItem(row_idx, 1, QTableWidgetItem(item["Description"] or ""))
-            self.table.setItem(row_idx, 2, QTableWidgetItem(str(item["Total Qty"])))
-            self.table.setItem(row_idx, 3, QTableWidgetItem(str(item["Used Qty"])))
+            self.table.setItem(row_idx, 0, _readonly_item(item["Item Code"] or ""))
+            self.table.setItem(row_idx, 1, _readonly_item(item["Description"] or ""))
+            self.table.setItem(row_idx, 2, _readonly_item(str(item["Total Qty"])))
+            self.table.setItem(row_idx, 3, _readonly_item(str(item["Used Qty"])))
             remaining_qty = item["Remaining Qty"] or 0
-            self.table.setItem(row_idx, 4, QTableWidgetItem(str(remaining_qty)))
-            self.table.setItem(row_idx, 5, QTableWidgetItem(item["Unit"] or ""))
-            self.table.setItem(row_idx, 6, QTableWidgetItem(str(item.get("Bore") or "")))
-            self.table.setItem(row_idx, 7, QTableWidgetItem(item.get("Type") or ""))
+            self.table.setItem(row_idx, 4, _readonly_item(str(remaining_qty)))
+            self.table.setItem(row_idx, 5, _readonly_item(item["Unit"] or ""))
+            self.table.setItem(row_idx, 6, _readonly_item(str(item.get("Bore") or "")))
+            self.table.setItem(row_idx, 7, _readonly_item(item.get("Type") or ""))
 
             # مصرف موجود در این MIV
             current_miv_total_usage = self.existing_consumptions.get(mto_item_id, 0)
@@ -633,13 +995,10 @@ class MTOConsumptionDialog(QDialog):
             # دکمه انتخاب اسپول
             spool_btn = QPushButton("انتخاب...")
 
-            # --- NEW: بررسی سازگاری آیتم با انبار اسپول ---
-            item_type = item.get("Type")
-            p1_bore = item.get("Bore")
-            # از تابع جدید DataManager برای گرفتن آیتم‌های سازگار استفاده می‌کنیم
-            matching_items = self.dm.get_mapped_spool_items(item_type, p1_bore)
+            # --- NEW: بررسی سازگاری آیتم با انبار اسپول (از قبل در ترد بارگذاری محاسبه شده) ---
+            has_match = self._spool_matches.get((item.get("Type"), item.get("Bore")), False)
 
-            if not matching_items:  # 🚫 اگر هیچ اسپولی پیدا نشد
+            if not has_match:  # 🚫 اگر هیچ اسپولی پیدا نشد
                 spool_btn.setEnabled(False)
                 spool_btn.setToolTip("هیچ آیتم سازگاری در انبار اسپول یافت نشد.")
 
@@ -648,21 +1007,13 @@ class MTOConsumptionDialog(QDialog):
 
             # ستون‌های اطلاعات اسپول
             for col in [10, 11, 12]:
-                self.table.setItem(row_idx, col, QTableWidgetItem(""))
+                self.table.setItem(row_idx, col, _readonly_item(""))
 
             # اگر کلا آیتمی باقی نمانده، همه کنترل‌ها غیرفعال شوند
             if max_val <= 0:
                 spin_box.setEnabled(False)
                 spool_btn.setEnabled(False)
 
-            # ستون‌های اطلاعاتی فقط-خواندنی
-            for col in list(range(8)) + [10, 11, 12]:
-                item_widget = self.table.item(row_idx, col)
-                if item_widget:
-                    item_widget.setFlags(item_widget.flags() & ~Qt.ItemFlag.ItemIsEditable)
-
-        self.table.resizeColumnsToContents()
-
     def handle_spool_selection(self, row_idx):
         item_data = self.progress_data[row_idx]
         item_type = item_data.get("Type")
@@ -703,19 +1054,14 @@ class MTOConsumptionDialog(QDialog):
 
         total_spool_qty = sum(s['used_qty'] for s in selections)
 
-        session = self.dm.get_session()
-        try:
-            first_selection = selections[0]
-            spool_item = session.get(SpoolItem, first_selection['spool_item_id'])
-            spool_id_text = str(spool_item.spool.spool_id)
-            if len(selections) > 1:
-                spool_id_text += f" (+{len(selections) - 1} more)"
-
-            self.table.item(row_idx, 10).setText(spool_id_text)  # Spool ID
-            self.table.item(row_idx, 11).setText(str(total_spool_qty))  # Qty from Spool
-            self.table.item(row_idx, 12).setText(str(spool_item.qty_available - first_selection['used_qty']))
-        finally:
-            session.close()
+        first_selection = selections[0]
+        spool_id_text = first_selection['spool_id']
+        if len(selections) > 1:
+            spool_id_text += f" (+{len(selections) - 1} more)"
+
+        self.table.item(row_idx, 10).setText(spool_id_text)  # Spool ID
+        self.table.item(row_idx, 11).setText(str(total_spool_qty))  # Qty from Spool
+        self.table.item(row_idx, 12).setText(str(first_selection['qty_after']))
 # TODO: Add unit tests for this function
 
         item_data = self.progress_data[row_idx]
@@ -829,6 +1175,86 @@ class MTOConsumptionDialog(QDialog):
             QMessageBox.critical(self, "خطای بحرانی", f"خطا در اجرای بهینه‌ساز: {e}")
 
 # --- پنجره اصلی برنامه ---
+_REC_FIELDS = attrgetter("id", "miv_tag", "location", "status", "comment",
+                         "registered_for", "registered_by", "last_updated")
+
+
+class MivResultsModel(QAbstractTableModel):
+    """
+    مدل فقط-خواندنی نتایج جستجوی MIV برای QTableView.
+    متن هر سلول فقط هنگام درخواست view (ردیف‌های قابل مشاهده) ساخته می‌شود، نه یک QTableWidgetItem برای هر سلول.
+    """
+    HEADERS = ["ID", "MIV Tag", "Location", "Status", "Comment",
+               "Registered For", "Registered By", "Last Updated"]
+
+    def __init__(self, records, parent=None):
+        super().__init__(parent)
+        self._rows = records
+        self._texts = {}  # متن‌های آماده هر ردیف؛ در اولین نمایش ردیف ساخته می‌شود
+
+    def _row_texts(self, row):
+        texts = self._texts.get(row)
+        if texts is None:
+            vals = _REC_FIELDS(self._rows[row])
+            last_updated = vals[7]
+            texts = (str(vals[0]), *[v or "" for v in vals[1:7]],
+                     last_updated.strftime('%Y-%m-%d %H:%M') if last_updated else "")
+            self._texts[row] = texts
+        return texts
+
+    def record(self, row):
+        return self._rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        return self._row_texts(index.row())[index.column()]
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+
+class IsoResultsModel(QAbstractTableModel):
+    """مدل فقط-خواندنی فایل‌های ISO/DWG یافت‌شده (نام فایل و پوشه) برای QTableView."""
+    HEADERS = ["File", "Folder"]
+
+    def __init__(self, paths, parent=None):
+        super().__init__(parent)
+        self._paths = paths
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._paths)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        # os.path.split مسیر را یک بار به (پوشه، نام فایل) تقسیم می‌کند
+        folder, name = os.path.split(self._paths[index.row()])
+        return name if index.column() == 0 else folder
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+
+def _log_format(color):
+    fmt = QTextCharFormat()
+    fmt.setForeground(QColor(color))
+    return fmt
+
+
 class MainWindow(QMainWindow):
 
     def __init__(self):
@@ -846,12 +1272,28 @@ class MainWindow(QMainWindow):
         self.current_project: Project | None = None
         self.current_user = os.getlogin()
         self.suggestion_data = []
+        self._suggestion_by_display = {}
         self.dashboard_password = "hossein" #DASHBOARD_PASSWORD
 
         # <<< CHANGE: تایمر برای Debouncing اضافه شد
         self.suggestion_timer = QTimer(self)
         self.suggestion_timer.setSingleShot(True)
-        self.suggestion_timer.setInterval(800)  # 300 میلی‌ثانیه تاخیر
+        self.suggestion_timer.setInterval(150)  # ۱۵۰ میلی‌ثانیه سکوت پس از آخرین کلید
+        self._pending_prefix = ""  # آخرین متن تایپ‌شده که منتظر کوئری است
+        self._suggest_seq = 0  # شماره ترتیبی آخرین درخواست؛ نتایج قدیمی‌تر دور ریخته می‌شوند
+
+        # تایمر Debounce برای داشبورد خط؛ چند درخواست پشت سر هم فقط یک کوئری و یک رسم نمودار دارند
+        self._dash_timer = QTimer(self)
+        self._dash_timer.setSingleShot(True)
+        self._dash_timer.setInterval(250)
+        self._dash_timer.timeout.connect(self._do_update_line_dashboard)
+        self._pending_dash_line = None
+
+        self._iso_search_busy = False  # جلوگیری از اجرای هم‌زمان چند جستجوی ISO
+
+        # ایندکس پیشوندی شماره خط‌ها در حافظه (کلیدهای مرتب + ردیف‌های موازی)؛ تا بارگذاری نشده None است
+        self._line_keys = None
+        self._line_rows = []
 
         self.iso_observer = None  # متغیر برای نگه داشتن ترد نگهبان
 
@@ -962,7 +1404,10 @@ class MainWindow(QMainWindow):
         self.line_completer_model = QStringListModel()  # # مدل کامپلتر
         self.line_completer = QCompleter(self.line_completer_model, self)  # # خود کامپلتر
         self.line_completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)  # # حساس نبودن به بزرگی حروف
-        self.line_completer.setFilterMode(Qt.MatchFlag.MatchContains)  # # جستجوی شامل
+        # مدل به صورت مرتب (غیرحساس به حروف) پر می‌شود تا QCompleter به جای اسکن خطی از جستجوی دودویی استفاده کند
+        self.line_completer.setFilterMode(Qt.MatchFlag.MatchStartsWith)  # # جستجوی پیشوندی
+        self.line_completer.setModelSorting(QCompleter.ModelSorting.CaseInsensitivelySortedModel)
+        self.line_completer.setMaxVisibleItems(15)
         self.entries["Line No"].setCompleter(self.line_completer)  # # اتصال کامپلتر به فیلد
 
         # # اتصال دکمه جستجو به هندلر جدید
@@ -987,15 +1432,14 @@ class MainWindow(QMainWindow):
 
         layout.addLayout(header_layout)  # چیدمان هدر را به طرح اصلی اضافه می‌کنیم
 
-        # نمودار پای‌چارت اصلی
-        self.fig = Figure(figsize=(5, 4), dpi=100)
-        self.canvas = FigureCanvas(self.fig)
-        layout.addWidget(self.canvas)
-
-        self.dashboard_ax = self.fig.add_subplot(111)
-        self.dashboard_ax.text(0.5, 0.5, "Enter a line number", ha='center', va='center')
-
-        self.canvas.draw()
+        # نمودار پای‌چارت اصلی تا اولین به‌روزرسانی داشبورد ساخته نمی‌شود؛ تا آن زمان یک لیبل جای آن است
+        self.dashboard_layout = layout
+        self.dashboard_placeholder = QLabel("داشبورد پس از انتخاب یک خط نمایش داده می‌شود. (Enter a line number)")
+        self.dashboard_placeholder.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.dashboard_placeholder.setMinimumHeight(300)
+        layout.addWidget(self.dashboard_placeholder)
+        self.canvas = None
+        self._pie = None  # (wedges, texts, autotexts) نمودار فعلی؛ برای به‌روزرسانی درجا نگه داشته می‌شود
 
         # دکمه نمایش جزئیات (این دکمه می‌تواند باقی بماند یا حذف شود)
         self.details_btn = QPushButton("نمایش جزئیات کامل پروژه")
@@ -1088,8 +1532,21 @@ class MainWindow(QMainWindow):
         # --- NEW: اتصال سیگنال پیشرفت به اسلات جدید ---
         self.iso_event_handler.progress_updated.connect(self.update_iso_progress)
 
-    def on_text_changed(self):
-        """هر بار که متن تغییر می‌کند، تایمر را ری‌استارت می‌کند."""
+    MIN_SUGGEST_LENGTH = 3
+    SUGGESTION_LIMIT = 50  # سقف تعداد پیشنهادها که در خود کوئری SQL اعمال می‌شود
+
+    def on_text_changed(self, text):
+        """هر بار که متن تغییر می‌کند، تایمر را ری‌استارت می‌کند؛ فقط آخرین متن پس از مکث به دیتابیس می‌رود."""
+        # هر دو فیلد Line No و جستجو به این اسلات وصل هستند؛ فقط فیلدی که کاربر در آن تایپ می‌کند پردازش می‌شود
+        # (تغییرات برنامه‌ای مثل setText روی فیلد دیگر نباید پیشنهادهای فیلد فعال را باطل کنند)
+        if self.sender() is not QApplication.focusWidget():
+            return
+        self._pending_prefix = text
+        self._suggest_seq += 1  # هر نتیجه‌ای که برای متن قبلی در راه است باطل می‌شود
+        if len(text) < self.MIN_SUGGEST_LENGTH:
+            self.suggestion_timer.stop()
+            self.line_completer_model.setStringList([])
+            return
         self.suggestion_timer.start()
 
     def populate_project_combo(self):
@@ -1106,6 +1563,24 @@ class MainWindow(QMainWindow):
                     self.project_combo.addItem(proj.name, userData=proj)
         except Exception as e:
             self.log_to_console(f"خطا در بارگذاری پروژه‌ها: {e}", "error")
+        self.refresh_line_index()
+
+    def refresh_line_index(self):
+        """ایندکس پیشوندی شماره خط‌ها را در پس‌زمینه از نو می‌سازد (پس از بارگذاری یا به‌روزرسانی داده‌ها)."""
+        worker = LineIndexWorker(self.dm)
+        worker.signals.done.connect(self._set_line_index)
+        worker.signals.failed.connect(self._on_line_index_failed)
+        QThreadPool.globalInstance().start(worker)
+
+    def _set_line_index(self, rows):
+        self._line_rows = rows
+        self._line_keys = [row['key'] for row in rows]
+
+    def _on_line_index_failed(self):
+        # ایندکس در حافظه کنار گذاشته می‌شود تا پیشنهادها از مسیر دیتابیس ادامه پیدا کنند
+        self._line_keys = None
+        self._line_rows = []
+        self.log_to_console("⚠️ ساخت ایندکس شماره خط‌ها ناموفق بود؛ پیشنهادها مستقیماً از دیتابیس خوانده می‌شوند.", "warning")
 
     def load_project(self):
         selected_index = self.project_combo.currentIndex()
@@ -1144,29 +1619,39 @@ class MainWindow(QMainWindow):
         """
         این متد تنها پس از اتمام زمان تایمر فراخوانی می‌شود.
         """
-        # تشخیص می‌دهیم کدام فیلد ورودی فعال است
-        focused_widget = QApplication.focusWidget()
-        if isinstance(focused_widget, QLineEdit):
-            text = focused_widget.text()
-        else:
-            return # اگر هیچ فیلدی فعال نبود، کاری نکن
+        text = self._pending_prefix
+        if len(text) < self.MIN_SUGGEST_LENGTH:
+            return
 
-        if len(text) < 2:
-            self.line_completer_model.setStringList([])
+        if self._line_keys is not None:
+            # جستجوی پیشوندی در ایندکس حافظه با bisect: O(log N + k) و بدون رفت‌وبرگشت به دیتابیس
+            key = text.casefold()
+            lo = bisect_left(self._line_keys, key)
+            hi = bisect_left(self._line_keys, key + "\uffff", lo)
+            self.apply_suggestions(self._suggest_seq, self._line_rows[lo:min(hi, lo + self.SUGGESTION_LIMIT)])
             return
 
-        # 1. دریافت داده‌های کامل از دیتابیس (با کوئری بهینه)
-        self.suggestion_data = self.dm.get_line_no_suggestions(text)
+        # 1. تا آماده شدن ایندکس، دریافت داده‌های کامل از دیتابیس روی ترد پس‌زمینه؛ نتیجه از طریق سیگنال برمی‌گردد
+        worker = SuggestionWorker(self.dm, text, self._suggest_seq, self.SUGGESTION_LIMIT)
+        worker.signals.done.connect(self.apply_suggestions)
+        QThreadPool.globalInstance().start(worker)
 
-        # 2. استخراج متن نمایشی برای Completer
-        display_list = [item['display'] for item in self.suggestion_data]
+    def apply_suggestions(self, seq, data):
+        """نتیجه کوئری پیشنهاد را فقط اگر هنوز مربوط به آخرین متن تایپ‌شده باشد اعمال می‌کند."""
+        if seq != self._suggest_seq:
+            return
+        self.suggestion_data = data
+        self._suggestion_by_display = {item['display']: item for item in data}
+
+        # 2. استخراج متن نمایشی برای Completer (مرتب‌شده، مطابق setModelSorting)
+        display_list = sorted((item['display'] for item in self.suggestion_data), key=str.casefold)
         self.line_completer_model.setStringList(display_list)
 
     def on_suggestion_selected(self, selected_display_text):
         """
         وقتی کاربر یک پیشنهاد را انتخاب می‌کند، این متد فراخوانی می‌شود.
         """
-        selected_item = next((item for item in self.suggestion_data if item['display'] == selected_display_text), None)
+        selected_item = self._suggestion_by_display.get(selected_display_text)
 
         if not selected_item:
             return
@@ -1211,19 +1696,22 @@ class MainWindow(QMainWindow):
         form_data = {field: widget.text().strip().upper() for field, widget in self.entries.items()}
         form_data["Registered By"] = self.current_user
         form_data["Complete"] = False  # پیش‌فرض
+        project_id = self.current_project.id
+        line_no = form_data["Line No"]
+        miv_tag = form_data["MIV Tag"]
 
-        if not form_data["Line No"] or not form_data["MIV Tag"]:
+        if not line_no or not miv_tag:
             self.show_message("خطا", "فیلدهای Line No و MIV Tag اجباری هستند.", "warning")
             return
 
-        if self.dm.is_duplicate_miv_tag(form_data["MIV Tag"], self.current_project.id):
-            self.show_message("خطا", f"تگ '{form_data['MIV Tag']}' در این پروژه تکراری است.", "error")
+        if self.dm.is_duplicate_miv_tag(miv_tag, project_id):
+            self.show_message("خطا", f"تگ '{miv_tag}' در این پروژه تکراری است.", "error")
             return
 
         # اطمینان از وجود رکوردهای پیشرفت برای این خط
-        self.dm.initialize_mto_progress_for_line(self.current_project.id, form_data["Line No"])
+        self.dm.initialize_mto_progress_for_line(project_id, line_no)
 
-        dialog = MTOConsumptionDialog(self.dm, self.current_project.id, form_data["Line No"], parent=self)
+        dialog = MTOConsumptionDialog(self.dm, project_id, line_no, parent=self)
         if not dialog.exec():
             self.log_to_console("ثبت رکورد لغو شد.", "warning")
             return
@@ -1247,7 +1735,7 @@ class MainWindow(QMainWindow):
 
         form_data["Comment"] = " | ".join(comment_parts)
 
-        success, msg = self.dm.register_miv_record(self.current_project.id, form_data, consumed_items, spool_items)
+        success, msg = self.dm.register_miv_record(project_id, form_data, consumed_items, spool_items)
 
         if success:
             self.log_to_console(msg, "success")
@@ -1287,29 +1775,16 @@ class MainWindow(QMainWindow):
         dlg.resize(950, 450)
         layout = QVBoxLayout(dlg)
 
-        table = QTableWidget()
-        table.setColumnCount(8)
-        table.setHorizontalHeaderLabels([
-            "ID", "MIV Tag", "Location", "Status", "Comment",
-            "Registered For", "Registered By", "Last Updated"
-        ])
-        table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        # QTableView + مدل: سلول‌ها فقط برای ردیف‌های قابل مشاهده ساخته می‌شوند
+        table = QTableView()
+        results_model = MivResultsModel(records, table)
+        table.setModel(results_model)
+        table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
 
         table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
-        table.setRowCount(len(records))
-
-        for row, rec in enumerate(records):
-            table.setItem(row, 0, QTableWidgetItem(str(rec.id)))
-            table.setItem(row, 1, QTableWidgetItem(rec.miv_tag or ""))
-            table.setItem(row, 2, QTableWidgetItem(rec.location or ""))
-            table.setItem(row, 3, QTableWidgetItem(rec.status or ""))
-            table.setItem(row, 4, QTableWidgetItem(rec.comment or ""))
-            table.setItem(row, 5, QTableWidgetItem(rec.registered_for or ""))
-            table.setItem(row, 6, QTableWidgetItem(rec.registered_by or ""))
-            table.setItem(row, 7,
-                          QTableWidgetItem(rec.last_updated.strftime('%Y-%m-%d %H:%M') if rec.last_updated else ""))
-
+        # اندازه ستون‌ها فقط از روی نمونه‌ای از ردیف‌ها محاسبه می‌شود
+        table.horizontalHeader().setResizeContentsPrecision(50)
         table.resizeColumnsToContents()
         layout.addWidget(table)
 
@@ -1327,9 +1802,9 @@ class MainWindow(QMainWindow):
         layout.addLayout(btn_layout)
 
         def get_selected_record_id():
-            selected = table.currentRow()
+            selected = table.currentIndex().row()
             if selected < 0: return None
-            return int(table.item(selected, 0).text())
+            return results_model.record(selected).id
 
         def edit_record():
             record_id = get_selected_record_id()
@@ -1426,23 +1901,30 @@ class MainWindow(QMainWindow):
             return
 
         self.log_to_console(f"شروع فرآیند به‌روزرسانی برای {len(file_paths)} فایل انتخابی...", "info")
-        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
-        try:
-            self.log_to_console(f"شروع فرآیند به‌روزرسانی برای {len(file_paths)} فایل انتخابی...", "info")
-            QApplication.processEvents()
-
-            success, message = self.dm.process_selected_csv_files(file_paths)
 
-            if success:
-                self.log_to_console(message, "success")
-                self.show_message("موفق", message)
-                self.populate_project_combo()
-            else:
-                self.log_to_console(message, "error")
-                self.show_message("خطا", message, "error")
-        finally:
-            # <<< ADDED: بازگرداندن نشانگر ماوس به حالت عادی در هر صورت
-            QApplication.restoreOverrideCursor()
+        # پردازش روی QThread انجام می‌شود؛ پنجره پیشرفت تا پایان کار، پنجره اصلی را قفل نگه می‌دارد
+        self.csv_progress_dialog = QProgressDialog("در حال به‌روزرسانی داده‌ها از فایل‌های CSV...", None, 0, 100, self)
+        self.csv_progress_dialog.setWindowTitle("به‌روزرسانی داده‌ها")
+        self.csv_progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.csv_progress_dialog.setMinimumDuration(0)
+        self.csv_progress_dialog.setValue(0)
+
+        self.csv_worker = CsvUpdateWorker(self.dm, file_paths, self)
+        self.csv_worker.progress.connect(self.csv_progress_dialog.setValue)
+        self.csv_worker.done.connect(self._on_csv_update_done)
+        self.csv_worker.finished.connect(self.csv_worker.deleteLater)
+        self.csv_worker.start()
+
+    def _on_csv_update_done(self, success, message):
+        self.csv_progress_dialog.close()
+        self.csv_worker = None
+        if success:
+            self.log_to_console(message, "success")
+            self.show_message("موفق", message)
+            self.populate_project_combo()
+        else:
+            self.log_to_console(message, "error")
+            self.show_message("خطا", message, "error")
 
     def handle_iso_search(self):
         raw_line = (self.entries.get("Line No").text() if self.entries.get("Line No") else "").strip()
@@ -1450,13 +1932,29 @@ class MainWindow(QMainWindow):
             self.log_to_console("⚠️ لطفاً ابتدا Line No را وارد کنید.", level="warning")
             return
 
-        try:
-            # جستجو حالا بسیار ساده و سریع است و به هیچ پارامتر اضافه‌ای نیاز ندارد
-            matches = self.dm.find_iso_files(raw_line)
-        except Exception as e:
-            self.log_to_console(f"❌ جستجوی فایل‌ها با خطا مواجه شد: {e}", level="error")
+        if self._iso_search_busy:
             return
 
+        # جستجو روی ترد پس‌زمینه اجرا می‌شود و دیالوگ نتایج پس از رسیدن سیگنال ساخته می‌شود
+        self._iso_search_busy = True
+        self.iso_search_btn.setEnabled(False)
+        self.iso_search_btn.setText("⏳ در حال جستجو...")
+        worker = IsoSearchWorker(self.dm, raw_line)
+        worker.signals.done.connect(self._on_iso_search_done)
+        worker.signals.failed.connect(self._on_iso_search_failed)
+        QThreadPool.globalInstance().start(worker)
+
+    def _finish_iso_search(self):
+        self._iso_search_busy = False
+        self.iso_search_btn.setEnabled(True)
+        self.iso_search_btn.setText("🔎 جستجوی فایل‌های ISO/DWG")
+
+    def _on_iso_search_failed(self, message):
+        self._finish_iso_search()
+        self.log_to_console(f"❌ جستجوی فایل‌ها با خطا مواجه شد: {message}", level="error")
+
+    def _on_iso_search_done(self, matches):
+        self._finish_iso_search()
         if not matches:
             self.log_to_console("⚠️ فایلی مطابق با Line No واردشده پیدا نشد.", level="warning")
             return
@@ -1472,87 +1970,149 @@ class MainWindow(QMainWindow):
         info_label = QLabel("برای باز کردن فایل دوبار کلیک کنید یا روی «Open» بزنید.")
         v_layout.addWidget(info_label)  # ENHANCE: Add logging for debugging
 
-        table = QTableWidget(len(matches), 2, dlg)
-        table.setHorizontalHeaderLabels(["File", "Folder"])
+        table = QTableView(dlg)
+        table.setModel(IsoResultsModel(matches, table))
+        table.horizontalHeader().setResizeContentsPrecision(50)
         table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
         table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
-        table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
         v_layout.addWidget(table)
 
-        for r, path in enumerate(matches):
-            name = os.path.basename(path)
-            folder = os.path.dirname(path)
-            table.setItem(r, 0, QTableWidgetItem(name))
-            table.setItem(r, 1, QTableWidgetItem(folder))
-
-        row_to_path = {i: p for i, p in enumerate(matches)}
-
         buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Open | QDialogButtonBox.StandardButton.Close,
                                    parent=dlg)
         v_layout.addWidget(buttons)
 
         def _open_selected():
-            row = table.currentRow()
+            row = table.currentIndex().row()
             if row < 0:
                 return
-            path = row_to_path.get(row)
+            path = matches[row]
             try:
-                os.startfile(path)
+                # باز کردن از طریق سرویس دسکتاپ Qt، بدون منتظر ماندن ترد رابط کاربری برای shell
+                if not QDesktopServices.openUrl(QUrl.fromLocalFile(path)):
+                    raise OSError("برنامه‌ای برای باز کردن این نوع فایل یافت نشد")
                 self.log_to_console(f"📂 فایل باز شد: {path}", level="info")
             except Exception as e:
                 self.log_to_console(f"❌ خطا در باز کردن فایل {path}: {e}", level="error")
 
         buttons.button(QDialogButtonBox.StandardButton.Open).clicked.connect(_open_selected)
         buttons.rejected.connect(dlg.reject)
-        table.cellDoubleClicked.connect(lambda *_: _open_selected())
+        table.doubleClicked.connect(lambda *_: _open_selected())
 
         dlg.exec()
 
     def update_line_dashboard(self, line_no=None):
+        """به‌روزرسانی داشبورد را زمان‌بندی می‌کند؛ فقط آخرین درخواست در بازه ۲۵۰ میلی‌ثانیه اجرا می‌شود."""
+        self._pending_dash_line = line_no
+        self._dash_timer.start()
+
+    def _do_update_line_dashboard(self):
+        line_no = self._pending_dash_line
         if not self.current_project:
             return
 
         if line_no is None:
             line_no = self.entries["Line No"].text().strip()
 
-        self.dashboard_ax.clear()
-
         if not line_no:
-            self.dashboard_ax.text(0.5, 0.5, "Please enter the line number", ha='center', va='center')
-            self.canvas.draw()
+            self._show_dashboard_message("Please enter the line number")
             return
 
         progress = self.dm.get_line_progress(self.current_project.id, line_no)
         percentage = progress.get("percentage", 0)
 
         if progress["total_weight"] == 0:
-            self.dashboard_ax.text(0.5, 0.5, "No data found for this line", ha='center', va='center')
-            self.canvas.draw()
+            self._show_dashboard_message("No data found for this line")
             return
 
-        labels = ['Used', 'Remaining']
+        self._ensure_dashboard_canvas()
+        if self._pie is None:
+            # اولین رسم: نمودار کامل ساخته و آرتیست‌های آن نگه داشته می‌شوند
+            self.dashboard_ax.clear()
+            labels = ['Used', 'Remaining']
+            sizes = [percentage, 100 - percentage]
+            colors = ['#4CAF50', '#BDBDBD']
+            explode = (0.1, 0) if percentage > 0 else (0, 0)
+
+            self._pie = self.dashboard_ax.pie(
+                sizes, explode=explode, labels=labels, colors=colors,
+                autopct='%1.1f%%', shadow=True, startangle=90
+            )
+            self.dashboard_ax.axis('equal')
+            self.dashboard_ax.set_title(f"Line progress: {line_no} ({percentage}%)")
+            self.fig.tight_layout()
+        else:
+            # رسم‌های بعدی: فقط زاویه‌ها و متن‌های برش‌های موجود جابه‌جا می‌شوند (بدون clear و layout مجدد)
+            self._update_pie(percentage)
+            self.dashboard_ax.set_title(f"Line progress: {line_no} ({percentage}%)")
 
-        sizes = [percentage, 100 - percentage]
-        colors = ['#4CAF50', '#BDBDBD']
-        explode = (0.1, 0) if percentage > 0 else (0, 0)
+        self.canvas.draw_idle()
 
-        self.dashboard_ax.pie(
-            sizes, explode=explode, labels=labels, colors=colors,
-            autopct='%1.1f%%', shadow=True, startangle=90
-        )
-        self.dashboard_ax.axis('equal')
-# REFACTOR: Extract this logic to separate function
-        self.dashboard_ax.set_title(f"Line progress: {line_no} ({percentage}%)")
+    def _ensure_dashboard_canvas(self):
+        """در اولین نیاز، matplotlib را بارگذاری کرده و بوم نمودار را جایگزین لیبل موقت می‌کند."""
+        if self.canvas is not None:
+            return
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=(5, 4), dpi=100)
+        self.canvas = FigureCanvas(self.fig)
+        self.dashboard_ax = self.fig.add_subplot(111)
+        self.dashboard_layout.replaceWidget(self.dashboard_placeholder, self.canvas)
+        self.dashboard_placeholder.deleteLater()
+        self.dashboard_placeholder = None
+
+    def _show_dashboard_message(self, message):
+        self._ensure_dashboard_canvas()
+        self.dashboard_ax.clear()
+        self._pie = None
+        self.dashboard_ax.text(0.5, 0.5, message, ha='center', va='center')
+        self.canvas.draw_idle()
 
-        self.fig.tight_layout()
-        self.canvas.draw()
+    def _update_pie(self, percentage):
+        """
+        برش‌های نمودار دایره‌ای موجود را مانند ax.pie(startangle=90, explode=(0.1, 0)) برای درصد جدید جابه‌جا می‌کند.
+        سایه‌ها مسیر برش‌ها را دنبال می‌کنند و نیازی به ساخت مجدد ندارند.
+        """
+        wedges, texts, autotexts = self._pie
+        split = 90 + 360 * percentage / 100
+        explode = (0.1, 0) if percentage > 0 else (0, 0)
+        fractions = (percentage, 100 - percentage)
+
+        for wedge, label, autotext, (theta1, theta2), offset, frac in zip(
+                wedges, texts, autotexts, ((90, split), (split, 450)), explode, fractions):
+            mid = math.radians((theta1 + theta2) / 2)
+            cx, cy = offset * math.cos(mid), offset * math.sin(mid)
+            wedge.set_center((cx, cy))
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+
+            # همان فاصله‌های پیش‌فرض pie: labeldistance=1.1 و pctdistance=0.6
+            label_x = cx + 1.1 * math.cos(mid)
+            label.set_position((label_x, cy + 1.1 * math.sin(mid)))
+            label.set_horizontalalignment('left' if label_x > 0 else 'right')
+            autotext.set_position((cx + 0.6 * math.cos(mid), cy + 0.6 * math.sin(mid)))
+            autotext.set_text(f"{frac:.1f}%")
+
+    # فرمت رنگی هر سطح لاگ یک بار ساخته می‌شود؛ متن بدون عبور از پارسر HTML مستقیم در سند درج می‌شود
+    LOG_FORMATS = {level: _log_format(color) for level, color in
+                   {"info": "#8be9fd", "success": "#50fa7b", "warning": "#f1fa8c", "error": "#ff5555"}.items()}
+    DEFAULT_LOG_FORMAT = _log_format("#f8f8f2")
 
     def log_to_console(self, message, level="info"):
-        color_map = {"info": "#8be9fd", "success": "#50fa7b", "warning": "#f1fa8c", "error": "#ff5555"}
-        color = color_map.get(level, "#f8f8f2")
-        formatted_message = f'<span style="color: {color};">{message}</span>'
-        self.console_output.append(formatted_message)
+        scrollbar = self.console_output.verticalScrollBar()
+        at_bottom = scrollbar.value() == scrollbar.maximum()
+
+        cursor = QTextCursor(self.console_output.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        if not self.console_output.document().isEmpty():
+            cursor.insertBlock()
+        cursor.insertText(str(message), self.LOG_FORMATS.get(level, self.DEFAULT_LOG_FORMAT))
+
+        # مانند append: فقط اگر کاربر در انتهای کنسول بوده، به پایین اسکرول شود
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
 
     def show_message(self, title, message, level="info"):
         msg_box = QMessageBox(self)
@@ -1627,19 +2187,39 @@ class MainWindow(QMainWindow):
         """
         QMessageBox.about(self, title, text)
 
+    SHUTDOWN_TIMEOUT_SECONDS = 5.0
+    PROCESS_TERMINATE_TIMEOUT_SECONDS = 2.0
+
+    def _stop_process(self, process):
+        """
+        پروسه جانبی را ابتدا با terminate متوقف می‌کند تا فرصت بستن اتصال SQLite (و checkpoint فایل WAL) را داشته باشد؛
+        فقط اگر در مهلت تعیین‌شده بسته نشد، kill می‌شود.
+        """
+        if process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=self.PROCESS_TERMINATE_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
     def cleanup_processes(self):
         """کشتن کامل پروسه‌های جانبی و ترد نگهبان."""
         # ... کد قبلی برای بستن api_process و dashboard_process ...
         try:
             if hasattr(self, 'api_process') and self.api_process:
-                self.api_process.kill()
+                self._stop_process(self.api_process)
             if hasattr(self, 'dashboard_process') and self.dashboard_process:
-                self.dashboard_process.kill()
+                self._stop_process(self.dashboard_process)
 
             # توقف ترد نگهبان
             if self.iso_observer:
                 self.iso_observer.stop()
-                self.iso_observer.join() # منتظر می‌مانیم تا ترد کاملا بسته شود
+                self.iso_observer.join(timeout=self.SHUTDOWN_TIMEOUT_SECONDS)  # بسته شدن برنامه نباید معطل watchdog بماند
+                if self.iso_observer.is_alive():
+                    self.log_to_console("ISO watcher did not stop in time.", "warning")
+                self.iso_event_handler.stop()  # رویدادهای در صف را قبل از خروج ثبت کن
                 self.log_to_console("ISO watcher stopped.", "info")
 
         except Exception as e:
@@ -1669,12 +2249,16 @@ class MainWindow(QMainWindow):
             self.iso_observer.stop()
             self.iso_observer.join()
 
+        from watchdog.observers import Observer
+
         self.iso_observer = Observer()
         self.iso_observer.schedule(self.iso_event_handler, path, recursive=True)
         self.iso_observer.start()
 
     def update_iso_progress(self, value):
         """اسلات برای آپدیت کردن مقدار QProgressBar."""
+        if value == self.iso_progress_bar.value() and self.iso_progress_bar.isVisible():
+            return  # مقدار تکراری؛ نیازی به بازترسیم نیست
         if value < 100:
             if not self.iso_progress_bar.isVisible():
                 self.iso_progress_bar.show()
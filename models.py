@@ -42,6 +42,7 @@ class MIVRecord(Base):
     # <<< ADDED: ایندکس ترکیبی برای جستجوهای متداول
     __table_args__ = (
         Index('ix_miv_records_project_line', 'project_id', 'line_no'),
+        Index('ix_miv_project_status', 'project_id', 'status'),
     )
 
 # -------------------------
@@ -91,6 +92,10 @@ class MTOProgress(Base):
 
     __table_args__ = (
         UniqueConstraint('project_id', 'line_no', 'item_code', 'mto_item_id', name='uq_progress_item'),  # ✅ کلید یکتا
+        # کلید یکتای بالا جستجوی (project_id, line_no, item_code) را پوشش می‌دهد؛ این ایندکس برای جستجو با mto_item_id است
+        Index('ix_prog_mto_item', 'mto_item_id'),
+        # جمع‌بندی گزارش MTO Summary در سطح پروژه بر اساس item_code
+        Index('ix_prog_project_item', 'project_id', 'item_code'),
     )
 
 
@@ -106,6 +111,11 @@ class MTOConsumption(Base):
     used_qty = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index('ix_cons_item', 'mto_item_id'),
+        Index('ix_cons_miv', 'miv_record_id'),
+    )
+
 
 # -------------------------
 # جدول Activity Log
@@ -222,6 +232,10 @@ class IsoFileIndex(Base):
     prefix_key = Column(String, index=True) # ایندکس برای جستجوی سریع
     last_modified = Column(DateTime)
 
+    __table_args__ = (
+        Index('ix_iso_prefix_norm', 'prefix_key', 'normalized_name'),
+    )
+
 # -------------------------
 # تابع ایجاد دیتابیس و جداول
 # -------------------------
@@ -1,156 +1,433 @@
 # file: report_api.py
 
-from flask import Flask, jsonify, request
+import os
+import time
+import logging
+import threading
+import orjson
+from functools import wraps
+from urllib.parse import urlencode
+from flask import Flask, Response, g, request, stream_with_context
+from flask.json.provider import JSONProvider
 from data_manager import DataManager
 from flask_cors import CORS
+from flask_caching import Cache
+from flask_compress import Compress
 from config_manager import DB_PATH
 
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    JSON provider فلسک بر پایه orjson (پیاده‌سازی C) که برای لیست‌های بزرگ گزارش‌ها چند برابر سریع‌تر از json استاندارد است.
+    - خروجی همیشه فشرده و بدون مرتب‌سازی کلیدهاست.
+    - انواعی که orjson نمی‌شناسد (مثل Decimal) مانند Flask به رشته تبدیل می‌شوند.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # بایت‌های orjson مستقیماً بدنه پاسخ می‌شوند، بدون تبدیل میانی به str
+        return self._app.response_class(
+            orjson.dumps(obj, default=str, option=ORJSON_OPTIONS), mimetype="application/json")
+
+
 app = Flask(__name__)
+app.json_provider_class = OrjsonProvider
+app.json = OrjsonProvider(app)
 # فعال کردن CORS برای اینکه داشبورد بتواند به راحتی با API ارتباط برقرار کند
 CORS(app)
 
+# کش گزارش‌ها: داشبورد مدام همان گزارش‌ها را درخواست می‌کند و لازم نیست هر بار به دیتابیس برویم.
+# کلید کش شامل نسخه داده دیتابیس است، پس هر تغییری (حتی از پروسه برنامه دسکتاپ) فوراً کش را بی‌اعتبار می‌کند.
+REPORT_CACHE_TIMEOUT = 60
+INVENTORY_CACHE_TIMEOUT = 60
+LINES_CACHE_TIMEOUT = 120
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": REPORT_CACHE_TIMEOUT})
+
+# فشرده‌سازی پاسخ‌های JSON بزرگ‌تر از 1KB (br یا gzip بسته به پشتیبانی کلاینت) با سطح سریع.
+# پاسخ‌های استریمی فشرده نمی‌شوند تا ارسال تکه‌تکه آن‌ها حفظ شود.
+app.config.update(
+    COMPRESS_MIMETYPES=["application/json"],
+    COMPRESS_ALGORITHM=["br", "gzip"],
+    COMPRESS_LEVEL=4,
+    COMPRESS_BR_LEVEL=4,
+    COMPRESS_MIN_SIZE=1024,
+    COMPRESS_STREAMS=False,
+)
+Compress(app)
+
 """Refactored for better maintainability."""
 
 """Updated with type hints for clarity."""
 
-dm = DataManager(db_path=DB_PATH)
+API_HOST = "127.0.0.1"
+API_PORT = 5000
+API_THREADS = int(os.environ.get("REPORT_API_THREADS", 8))
+
+# یک DataManager (و یک استخر اتصال) برای کل پروسه؛ هر ترد سرور یک اتصال جدا از استخر می‌گیرد
+dm = DataManager(db_path=DB_PATH, pool_size=API_THREADS)
+# نام گزارش‌های تحلیلی معتبر یک بار از جدول dispatch ساخته می‌شود
+VALID_REPORTS = frozenset(DataManager.ANALYTICS_HANDLERS)
+
+# گزارش‌های تحلیلی سنگین‌اند؛ بدنه JSON هر (project_id, report_name) همراه نسخه داده نگه داشته می‌شود
+# و یک ترد پس‌زمینه هر ANALYTICS_REFRESH_SECONDS ثانیه ورودی‌های قدیمی را دوباره می‌سازد.
+ANALYTICS_REFRESH_SECONDS = 60
+_analytics_cache = {}  # (project_id, report_name) -> (data version, bytes)
+_analytics_lock = threading.Lock()
 
 # TODO: Add comprehensive error handling
 
+def ojson(data) -> Response:
+    """پاسخ JSON با provider مبتنی بر orjson برنامه (معادل jsonify)."""
+    return app.json.response(data)
+
+
+def stream_json_array(rows) -> Response:
+    """
+    یک iterable از ردیف‌ها را به صورت آرایه JSON و تکه‌تکه ارسال می‌کند؛
+    ارسال پیش از خواندن کامل cursor شروع می‌شود و کل لیست هیچ‌وقت در حافظه ساخته نمی‌شود.
+    """
+    def generate():
+        yield b"["
+        first = True
+        for row in rows:
+            if not first:
+                yield b","
+            yield orjson.dumps(row, default=str, option=ORJSON_OPTIONS)
+            first = False
+        yield b"]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+# --- شِمای پارامترهای query هر endpoint: نام -> (تابع تبدیل، مقدار پیش‌فرض) ---
+# یک بار در سطح ماژول ساخته می‌شوند و parse_args همه پارامترها را در یک حلقه می‌خواند.
+PROJECT_ARGS = {"project_id": (int, None)}
+
+LINE_ARGS = {
+    "project_id": (int, None),
+    "line_no": (str, None),
+}
+
+MTO_SUMMARY_ARGS = {
+    "project_id": (int, None),
+    "item_code": (str, None),
+    "description": (str, None),
+    "min_progress": (float, None),
+    "max_progress": (float, None),
+    "sort_by": (str, "Item Code"),
+    "sort_order": (str, "asc"),
+    # صفحه‌بندی اختیاری است؛ بدون آن کل گزارش (مثلاً برای دانلود CSV) برگردانده می‌شود
+    "page": (int, None),
+    "per_page": (int, None),
+}
+
+LINE_STATUS_ARGS = {
+    "project_id": (int, None),
+    "page": (int, None),
+    "per_page": (int, None),
+}
+
+SPOOL_INVENTORY_ARGS = {
+    "spool_id": (str, None),
+    "location": (str, None),
+    "component_type": (str, None),
+    "material": (str, None),
+    "sort_by": (str, "spool_id"),
+    "sort_order": (str, "asc"),
+    "page": (int, 1),
+    "per_page": (int, 20),
+}
+
+ACTIVITY_LOG_ARGS = {"limit": (int, 100)}
+
+
+def parse_args(schema, drop_none: bool = False) -> dict:
+    """
+    پارامترهای query را طبق شِما می‌خواند و تبدیل می‌کند (همان رفتار request.args.get(..., type=...)):
+    پارامتر غایب یا غیرقابل تبدیل مقدار پیش‌فرض را می‌گیرد.
+    با drop_none=True پارامترهای بدون مقدار در همان حلقه کنار گذاشته می‌شوند (فیلترهای فعال).
+    """
+    args = request.args
+    parsed = {}
+    for name, (cast, default) in schema.items():
+        value = args.get(name)
+        if value is None:
+            value = default
+        elif cast is not str:
+            try:
+                value = cast(value)
+            except (TypeError, ValueError):
+                value = default
+        if value is None and drop_none:
+            continue
+        parsed[name] = value
+    return parsed
+
+
+def data_version_tag():
+    """نسخه فعلی داده‌ها؛ در هر درخواست فقط یک بار از دیتابیس خوانده می‌شود."""
+    if "data_version_tag" not in g:
+        g.data_version_tag = dm.get_data_version_tag()
+    return g.data_version_tag
+
+
+def versioned_cache_key(*args, **kwargs):
+    """
+    کلید کش شامل نسخه داده است تا پس از هر تغییر در دیتابیس، پاسخ کش‌شده قدیمی برگردانده نشود.
+    پارامترهای query مرتب می‌شوند تا ترتیب آن‌ها در URL کلید جداگانه‌ای نسازد.
+    """
+    query = urlencode(sorted(request.args.items(multi=True)))
+    return f"{request.path}?{query}|{data_version_tag()}"
+
+
+def conditional_on_data_version(view):
+    """
+    ETag پاسخ را برابر نسخه داده قرار می‌دهد و اگر کلاینت همین نسخه را داشته باشد، 304 بدون بدنه برمی‌گرداند.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = data_version_tag()
+        if etag:
+            # Flask-Compress نام الگوریتم را به ETag پاسخ‌های فشرده اضافه می‌کند ("tag:gzip")
+            for client_tag in request.if_none_match:
+                if client_tag.split(":", 1)[0] == etag:
+                    response = Response(status=304)
+                    response.set_etag(client_tag)
+                    return response
+        response = app.make_response(view(*args, **kwargs))
+        if etag and response.status_code == 200:
+            response.set_etag(etag)
+        return response
+    return wrapper
+
+
+def build_analytics_json(project_id, report_name, tag):
+    """
+    گزارش تحلیلی را می‌سازد و بایت‌های JSON آن را (در صورت معلوم بودن نسخه داده) در کش نگه می‌دارد.
+    خروجی: (bytes, None) یا در صورت خطا (None, دیکشنری خطا).
+    """
+    data = dm.get_report_analytics(project_id, report_name)
+    if "error" in data:
+        return None, data
+    body = orjson.dumps(data, option=ORJSON_OPTIONS)
+    if tag is not None:
+        with _analytics_lock:
+            _analytics_cache[(project_id, report_name)] = (tag, body)
+    return body, None
+
+
+def refresh_analytics_cache():
+    """ورودی‌هایی از کش تحلیل‌ها را که نسخه داده‌شان عوض شده دوباره می‌سازد."""
+    tag = dm.get_data_version_tag()
+    if tag is None:
+        return
+    with _analytics_lock:
+        stale = [key for key, (cached_tag, _) in _analytics_cache.items() if cached_tag != tag]
+    for project_id, report_name in stale:
+        build_analytics_json(project_id, report_name, tag)
+
+
+def start_analytics_refresher():
+    """ترد پس‌زمینه (daemon) به‌روزرسانی دوره‌ای کش تحلیل‌ها را راه می‌اندازد."""
+    def run():
+        while True:
+            time.sleep(ANALYTICS_REFRESH_SECONDS)
+            try:
+                refresh_analytics_cache()
+            except Exception as e:
+                logging.error(f"Error refreshing analytics cache: {e}")
+
+    thread = threading.Thread(target=run, name="analytics-refresher", daemon=True)
+    thread.start()
+    return thread
+
+
 # --- Endpoints پایه ---
 
+# بدنه JSON آماده لیست پروژه‌ها همراه نسخه داده‌ای که از آن ساخته شده: (data version, bytes)
+_projects_json = (None, b"")
+_projects_lock = threading.Lock()
+
+
 @app.route("/api/projects")
+@conditional_on_data_version
 def get_projects():
-    """لیست تمام پروژه‌ها را برای استفاده در فیلترها برمی‌گرداند."""
-    projects = dm.get_all_projects()
-    projects_list = [{"id": p.id, "name": p.name} for p in projects]  # TODO: Add comprehensive error handling  # ENHANCE: Add logging for debugging
-    return jsonify(projects_list)
+    """
+    لیست تمام پروژه‌ها را برای استفاده در فیلترها برمی‌گرداند.
+    بایت‌های JSON تا تغییر نسخه داده دوباره استفاده می‌شوند (بدون کوئری و سریال‌سازی مجدد).
+    """
+    global _projects_json
+    tag = data_version_tag()
+    cached_tag, body = _projects_json
+    if tag is None or cached_tag != tag:
+        with _projects_lock:
+            cached_tag, body = _projects_json
+            if tag is None or cached_tag != tag:
+                projects = dm.get_all_projects()
+                projects_list = [{"id": p.id, "name": p.name} for p in projects]  # TODO: Add comprehensive error handling  # ENHANCE: Add logging for debugging
+                body = orjson.dumps(projects_list, option=ORJSON_OPTIONS)
+                if tag is not None:
+                    _projects_json = (tag, body)
+    return Response(body, mimetype="application/json")
 
 
 @app.route("/api/lines")
+@conditional_on_data_version
+@cache.cached(timeout=LINES_CACHE_TIMEOUT, make_cache_key=versioned_cache_key)
 def get_lines():
     """لیست تمام شماره خط‌های یک پروژه خاص را برمی‌گرداند."""
-    project_id = request.args.get("project_id", type=int)
+    project_id = parse_args(PROJECT_ARGS)["project_id"]
     if not project_id:
-        return jsonify({"error": "project_id is required"}), 400
+        return ojson({"error": "project_id is required"}), 400
+    if not dm.project_exists(project_id):
+        return ojson({"error": "project not found"}), 404
     lines = dm.get_lines_for_project(project_id)
-    return jsonify(lines)
+    return ojson(lines)
 
 
 # --- Endpoints جدید برای گزارش‌گیری ---
 
 @app.route("/api/reports/mto-summary")
+@conditional_on_data_version
+@cache.cached(make_cache_key=versioned_cache_key)
 def get_mto_summary_report():
-    project_id = request.args.get("project_id", type=int)
+    # جمع‌آوری فیلترها از query string (فقط فیلترهایی که مقدار دارند)
+    filters = parse_args(MTO_SUMMARY_ARGS, drop_none=True)
+    project_id = filters.pop("project_id", None)
     if not project_id:
-        return jsonify({"error": "project_id is required"}), 400
-
-    # جمع‌آوری فیلترها از query string
-    filters = {
-        'item_code': request.args.get('item_code', type=str),
-        'description': request.args.get('description', type=str),
-        'min_progress': request.args.get('min_progress', type=float),
-        'max_progress': request.args.get('max_progress', type=float),
-        'sort_by': request.args.get('sort_by', 'Item Code', type=str),
-        'sort_order': request.args.get('sort_order', 'asc', type=str)
-    }
-    # حذف فیلترهایی که مقدار ندارند
-    active_filters = {k: v for k, v in filters.items() if v is not None}
-
-    data = dm.get_project_mto_summary(project_id, **active_filters)
-    return jsonify(data)
+        return ojson({"error": "project_id is required"}), 400
+    if not dm.project_exists(project_id):
+        return ojson({"error": "project not found"}), 404
+
+    data = dm.get_project_mto_summary(project_id, **filters)
+    return ojson(data)
 
 @app.route("/api/reports/line-status")
+@conditional_on_data_version
+@cache.cached(make_cache_key=versioned_cache_key)
 def get_line_status_report():
     """گزارش وضعیت تمام خطوط یک پروژه را برمی‌گرداند."""
-    project_id = request.args.get("project_id", type=int)
-    if not project_id:
-        return jsonify({"error": "project_id is required"}), 400
-    data = dm.get_project_line_status_list(project_id)
-    return jsonify(data)
+    args = parse_args(LINE_STATUS_ARGS)
+    if not args["project_id"]:
+        return ojson({"error": "project_id is required"}), 400
+    if not dm.project_exists(args["project_id"]):
+        return ojson({"error": "project not found"}), 404
+    data = dm.get_project_line_status_list(**args)
+    return ojson(data)
 
 
 @app.route("/api/reports/detailed-line")
+@conditional_on_data_version
+@cache.cached(make_cache_key=versioned_cache_key)
 def get_detailed_line_report():
     """گزارش کامل و جزئیات یک خط خاص را برمی‌گرداند."""
-    project_id = request.args.get("project_id", type=int)
-    line_no = request.args.get("line_no", type=str)
+    args = parse_args(LINE_ARGS)
+    project_id, line_no = args["project_id"], args["line_no"]
     if not project_id or not line_no:
-        return jsonify({"error": "project_id and line_no are required"}), 400
+        return ojson({"error": "project_id and line_no are required"}), 400
+    if not dm.project_exists(project_id):
+        return ojson({"error": "project not found"}), 404
     data = dm.get_detailed_line_report(project_id, line_no)
-    return jsonify(data)
+    return ojson(data)
 
 
 @app.route("/api/reports/shortage")
+@conditional_on_data_version
+@cache.cached(make_cache_key=versioned_cache_key)
 def get_shortage_report():
     """گزارش کسری متریال یک پروژه (یا یک خط خاص از آن) را برمی‌گرداند."""
-    project_id = request.args.get("project_id", type=int)
-    line_no = request.args.get("line_no", default=None, type=str) # پارامتر جدید و اختیاری
+    args = parse_args(LINE_ARGS)
+    project_id, line_no = args["project_id"], args["line_no"]  # line_no پارامتر جدید و اختیاری
 
     if not project_id:
-        return jsonify({"error": "project_id is required"}), 400  # NOTE: Consider edge cases for empty inputs
+        return ojson({"error": "project_id is required"}), 400  # NOTE: Consider edge cases for empty inputs
+    if not dm.project_exists(project_id):
+        return ojson({"error": "project not found"}), 404
 
     # ارسال هر دو پارامتر به تابع دیتا منیجر
     data = dm.get_shortage_report(project_id, line_no)
-    return jsonify(data)
+    return ojson(data)
 
 @app.route("/api/reports/spool-inventory")
+@conditional_on_data_version
+@cache.cached(timeout=INVENTORY_CACHE_TIMEOUT, make_cache_key=versioned_cache_key)
 def get_spool_inventory_report():
-    filters = {
-        'spool_id': request.args.get('spool_id', type=str),
-        'location': request.args.get('location', type=str),
-        'component_type': request.args.get('component_type', type=str),
-        'material': request.args.get('material', type=str),
-        'sort_by': request.args.get('sort_by', 'spool_id', type=str),
-        'sort_order': request.args.get('sort_order', 'asc', type=str),
-        'page': request.args.get('page', 1, type=int),
-        'per_page': request.args.get('per_page', 20, type=int)
-    }
-    active_filters = {k: v for k, v in filters.items() if v is not None}
-    data = dm.get_spool_inventory_report(**active_filters)
-    return jsonify(data)
-
-
-@app.route("/api/reports/analytics/<report_name>")  # FIXME: Optimize this section for better performance
+    filters = parse_args(SPOOL_INVENTORY_ARGS, drop_none=True)
+    data = dm.get_spool_inventory_report(**filters)
+    return ojson(data)
+
+
+@app.route("/api/reports/analytics/<report_name>")
+@conditional_on_data_version
 def get_analytics_report(report_name):
-    project_id = request.args.get("project_id", type=int)
+    """
+    داده نمودارهای تحلیلی را برمی‌گرداند؛ اگر نسخه‌ای هم‌نسخه با داده فعلی در کش باشد
+    (معمولاً توسط ترد پس‌زمینه ساخته شده) همان بایت‌ها بدون محاسبه مجدد ارسال می‌شوند.
+    """
+    # نام‌های نامعتبر پیش از هر کار دیگری (و بدون رفتن سراغ دیتابیس) رد می‌شوند
+    if report_name not in VALID_REPORTS:
+        return ojson({"error": "Report name not found"}), 404
+
+    project_id = parse_args(PROJECT_ARGS)["project_id"]
+    if project_id is not None and not dm.project_exists(project_id):
+        return ojson({"error": "project not found"}), 404
     # برخی گزارش‌ها ممکن است به project_id نیاز نداشته باشند
     # if not project_id and report_name in ['line_progress_distribution', 'material_usage_by_type']:
-    #     return jsonify({"error": "project_id is required for this report"}), 400
+    #     return ojson({"error": "project_id is required for this report"}), 400
 
     # در اینجا می‌توانید پارامترهای بیشتری برای فیلتر کردن تحلیل‌ها بگیرید
-    # مثلاً بازه زمانی برای گزارش consumption_over_time
-    params = {}
-
-    data = dm.get_report_analytics(project_id, report_name, **params)
-    if "error" in data:
-        return jsonify(data), data.get("status_code", 500)
-    return jsonify(data)
+    # مثلاً بازه زمانی برای گزارش consumption_over_time (و آن‌ها را به کلید کش اضافه کنید)
+
+    tag = data_version_tag()
+    cached = _analytics_cache.get((project_id, report_name))
+    if cached is not None and tag is not None and cached[0] == tag:
+        body = cached[1]
+    else:
+        body, error = build_analytics_json(project_id, report_name, tag)
+        if error is not None:
+            return ojson(error), error.get("status_code", 500)
+    return Response(body, mimetype="application/json")
 
 @app.route("/api/reports/spool-consumption")
+@conditional_on_data_version
+@cache.cached(make_cache_key=versioned_cache_key)
 def get_spool_consumption_history():
     """گزارش تاریخچه مصرف اسپول‌ها را برمی‌گرداند (این گزارش سراسری است)."""
     data = dm.get_spool_consumption_history()
-    return jsonify(data)
+    return ojson(data)
 
 @app.route("/api/activity-logs")
+@conditional_on_data_version
 def get_activity_logs():
     """آخرین لاگ‌های فعالیت ثبت شده در سیستم را برمی‌گرداند."""
-    limit = request.args.get("limit", 100, type=int)
-    logs = dm.get_activity_logs(limit)
-    logs_list = [
-        {
-            "timestamp": log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            "user": log.user,
-            "action": log.action,
-            "details": log.details
-        } for log in logs
-    ]
-    return jsonify(logs_list)
+    limit = parse_args(ACTIVITY_LOG_ARGS)["limit"]
+    return stream_json_array(dm.iter_activity_log_rows(limit))
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    # سرور WSGI چندنخی تا درخواست‌های هم‌زمان داشبورد پشت یکدیگر صف نکشند.
+    # هر فراخوانی dm سشن مستقل خودش را می‌سازد، پس DataManager بین نخ‌ها مشترک می‌ماند.
+    # یک پروسه با چند ترد (نه چند worker) تا کش گزارش‌ها و ETagها بین همه درخواست‌ها مشترک بمانند.
+    if os.environ.get("FLASK_DEV"):
+        # فقط برای توسعه: سرور Flask با debug و reloader
+        app.run(host=API_HOST, port=API_PORT, debug=True)
+        raise SystemExit
+    start_analytics_refresher()
+    try:
+        from waitress import serve
+    except ImportError:
+        # اگر waitress نصب نباشد، سرور توسعه Flask در حالت چندنخی (بدون debug/reloader) اجرا می‌شود
+        app.run(host=API_HOST, port=API_PORT, threaded=True)
+    else:
+        serve(app, host=API_HOST, port=API_PORT, threads=API_THREADS)
 # Last modified: 2025-11-17 08:42:04
 
 # Updated: 2025-11-17 09:45:51